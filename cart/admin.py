@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from .models import Cart, CartItem, Order, OrderItem, SavedItem
+from .pricing import price_carts
+from .totals import refresh_order_totals
   
 
 class CartItemInline(admin.TabularInline):
@@ -12,23 +15,36 @@ class CartItemInline(admin.TabularInline):
 
     get_product_display.short_description = "Product / Variant"
 
+    def _priced_line(self, obj):
+        # Price the whole cart once and read every row from it.
+        return obj.cart.get_priced().line(obj) or obj
+
     def get_price(self, obj):
-        return obj.get_unit_price()
+        return self._priced_line(obj).get_unit_price()
 
     get_price.short_description = "Unit Price"
 
     def get_subtotal(self, obj):
-        return obj.get_subtotal()
+        return self._priced_line(obj).get_subtotal()
 
     get_subtotal.short_description = "Subtotal"
 
 
+class CartChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        price_carts(self.result_list)
+
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ("id", "customer", "session_key", "created_at", "updated_at", "get_total")
     search_fields = ("customer__username", "session_key")
     inlines = [CartItemInline]
 
+    def get_changelist(self, request, **kwargs):
+        return CartChangeList
+
     def get_total(self, obj):
         return obj.get_total()
 
@@ -53,17 +69,45 @@ class OrderItemInline(admin.TabularInline):
     get_subtotal.short_description = "Subtotal"
 
 
+class OrderTotalFilter(admin.SimpleListFilter):
+    title = "order total"
+    parameter_name = "total"
+
+    # (value, label, lower bound, upper bound) in Ugx
+    RANGES = [
+        ("lt50k", "Under 50,000", None, 50000),
+        ("50k-200k", "50,000 – 200,000", 50000, 200000),
+        ("200k-1m", "200,000 – 1,000,000", 200000, 1000000),
+        ("gte1m", "1,000,000 and over", 1000000, None),
+    ]
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, label, low, high in self.RANGES]
+
+    def queryset(self, request, queryset):
+        for value, label, low, high in self.RANGES:
+            if self.value() == value:
+                if low is not None:
+                    queryset = queryset.filter(total__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(total__lt=high)
+                return queryset
+        return queryset
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "customer", "status", "paid", "date", "get_total")
-    list_filter = ("status", "paid", "date")
+    list_display = ("id", "customer", "status", "paid", "date", "item_count", "total")
+    list_filter = ("status", "paid", OrderTotalFilter, "date")
+    list_select_related = ("customer",)
+    readonly_fields = ("item_count", "total")
     search_fields = ("customer__username", "id")
     inlines = [OrderItemInline]
 
-    def get_total(self, obj):
-        return obj.get_total()
-
-    get_total.short_description = "Order Total"
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Items may have been added, changed or deleted through the inline.
+        refresh_order_totals([form.instance.pk])
 
 
   
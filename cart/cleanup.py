@@ -0,0 +1,96 @@
+"""
+Removal of abandoned anonymous carts and expired checkout idempotency keys.
+
+Anonymous carts are found through a key kept in the visitor's session
+(``CART_SESSION_KEY``). The cart views ``touch`` a cart on every change, so
+a cart whose ``updated_at`` is older than the session cookie's lifetime is
+a candidate; other activity can keep its session alive, though, so with
+database sessions the candidates whose key an unexpired session still holds
+are kept. Cache and cookie sessions cannot be listed, and there the age
+alone decides. ``purge_abandoned_carts`` deletes abandoned carts and their
+items in small keyset-ordered batches, one short transaction each, so a
+large backlog never holds the SQLite write lock for long.
+
+Idempotency keys only need to outlive a client's retries;
+``purge_idempotency_keys`` drops those older than ``IDEMPOTENCY_KEY_TTL``
+the same way.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CART_SESSION_KEY, Cart, CartItem, IdempotencyKey
+
+# Carts untouched for the session cookie's lifetime are purge candidates.
+MAX_AGE = timedelta(seconds=getattr(settings, 'ANONYMOUS_CART_MAX_AGE', settings.SESSION_COOKIE_AGE))
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+BATCH_SIZE = 500
+
+# Session engines whose sessions are rows of the Session table.
+DB_SESSION_ENGINES = {
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+}
+
+
+def abandoned_carts(max_age=MAX_AGE, now=None):
+    """Anonymous carts last updated more than ``max_age`` ago."""
+    cutoff = (now or timezone.now()) - max_age
+    return Cart.objects.filter(customer__isnull=True, updated_at__lt=cutoff)
+
+
+def live_cart_keys(now=None):
+    """
+    Cart keys held by unexpired sessions, or ``None`` when the session
+    engine does not keep sessions in the database.
+    """
+    if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+        return None
+    sessions = Session.objects.filter(expire_date__gt=now or timezone.now())
+    keys = (session.get_decoded().get(CART_SESSION_KEY) for session in sessions.iterator())
+    return {key for key in keys if key}
+
+
+def purge_abandoned_carts(max_age=MAX_AGE, batch_size=BATCH_SIZE, dry_run=False, now=None):
+    """
+    Delete abandoned anonymous carts and their items, ``batch_size`` carts
+    per transaction. Yields ``(carts, items)`` counts per batch; with
+    ``dry_run`` nothing is deleted and the counts are what would be.
+    """
+    carts = abandoned_carts(max_age, now).order_by('pk').values_list('pk', 'session_key')
+    live_keys = live_cart_keys(now) or set()
+    last_pk = 0
+    while True:
+        rows = list(carts.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        batch = [pk for pk, key in rows if key not in live_keys]
+        if not batch:
+            continue
+        items = CartItem.objects.filter(cart_id__in=batch)
+        if dry_run:
+            yield len(batch), items.count()
+            continue
+        with transaction.atomic():
+            # Re-check the age as part of the delete: a cart touched since
+            # the batch was read is no longer abandoned.
+            deleted, per_model = abandoned_carts(max_age, now).filter(pk__in=batch).delete()
+        yield per_model.get(Cart._meta.label, 0), per_model.get(CartItem._meta.label, 0)
+
+
+def purge_idempotency_keys(ttl=IDEMPOTENCY_KEY_TTL, batch_size=BATCH_SIZE, now=None):
+    """Delete idempotency keys older than ``ttl`` in batches; return how many."""
+    expired = IdempotencyKey.objects.filter(created_at__lt=(now or timezone.now()) - ttl)
+    purged = 0
+    while True:
+        batch = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return purged
+        with transaction.atomic():
+            purged += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
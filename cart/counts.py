@@ -0,0 +1,71 @@
+"""
+Cached cart item counts for the navbar badge.
+
+The count (total quantity across a cart's lines) is cached under a key
+derived from the cart's owner, the user id or the anonymous cart key, so
+``cart_count`` can read it without loading the cart. The views that change
+a cart call ``refresh_item_count`` (or ``forget_item_count`` when a cart
+goes away); ``CACHE_TIMEOUT`` bounds how long a change made elsewhere, such
+as in the admin, can go unnoticed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import CART_SESSION_KEY, CartItem
+
+CACHE_TIMEOUT = getattr(settings, 'CART_COUNT_CACHE_TIMEOUT', 60 * 60)
+
+
+def _key(customer_id=None, session_key=None):
+    if customer_id:
+        return f'cart-count:user:{customer_id}'
+    return f'cart-count:session:{session_key}'
+
+
+def cache_key(cart):
+    """Cache key of ``cart``'s item count."""
+    return _key(cart.customer_id, cart.session_key)
+
+
+def _count(**lookup):
+    return CartItem.objects.filter(**lookup).aggregate(count=Sum('quantity'))['count'] or 0
+
+
+def get_item_count(request):
+    """
+    Item count of the current user's or session's cart, from the cache when
+    possible and with one query otherwise. Never creates a session or cart.
+    """
+    if request.user.is_authenticated:
+        key = _key(customer_id=request.user.pk)
+        lookup = {'cart__customer_id': request.user.pk}
+    else:
+        cart_key = request.session.get(CART_SESSION_KEY)
+        if not cart_key:
+            return 0
+        key = _key(session_key=cart_key)
+        lookup = {'cart__session_key': cart_key, 'cart__customer__isnull': True}
+
+    count = cache.get(key)
+    if count is None:
+        count = _count(**lookup)
+        cache.set(key, count, CACHE_TIMEOUT)
+    return count
+
+
+def refresh_item_count(cart):
+    """Recount ``cart``'s items after a change and cache the result."""
+    count = _count(cart=cart)
+    cache.set(cache_key(cart), count, CACHE_TIMEOUT)
+    return count
+
+
+def set_item_count(cart, count):
+    """Cache a count already known to be right (an emptied cart, say)."""
+    cache.set(cache_key(cart), count, CACHE_TIMEOUT)
+
+
+def forget_item_count(cart):
+    """Drop the cached count of a cart that no longer exists."""
+    cache.delete(cache_key(cart))
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cart.cleanup import BATCH_SIZE, MAX_AGE, purge_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete anonymous carts (and their items) not updated for longer than "
+        "the session cookie lifetime and held by no live session, in small "
+        "batches. Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=MAX_AGE / timedelta(days=1),
+            help=f"Age after which an untouched anonymous cart is abandoned (default {MAX_AGE.days}).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f"Carts deleted per transaction (default {BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Count the carts and items that would be deleted without deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError("--days and --batch-size must be positive.")
+
+        started = time.monotonic()
+        carts = items = batches = 0
+        for batch_carts, batch_items in purge_abandoned_carts(
+            max_age=timedelta(days=options['days']),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        ):
+            carts += batch_carts
+            items += batch_items
+            batches += 1
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"Batch {batches}: {batch_carts} carts, {batch_items} items")
+        elapsed = time.monotonic() - started
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        rate = carts / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {carts} abandoned carts and {items} items in {batches} batches "
+            f"in {elapsed:.2f}s ({rate:.0f} carts/s)."
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart.cleanup import BATCH_SIZE, IDEMPOTENCY_KEY_TTL, purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete checkout idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS, "
+        "in small batches. Run hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f"Keys deleted per transaction (default {BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        purged = purge_idempotency_keys(IDEMPOTENCY_KEY_TTL, batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} idempotency keys in {elapsed:.2f}s."))
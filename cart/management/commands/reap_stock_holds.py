@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart.stock import REAP_BATCH_SIZE, reap_holds
+
+
+class Command(BaseCommand):
+    help = "Delete expired checkout stock holds in bulk. Run every few minutes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REAP_BATCH_SIZE,
+            help=f"Holds deleted per statement (default {REAP_BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        reaped = reap_holds(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Reaped {reaped} expired stock holds in {elapsed:.2f}s."))
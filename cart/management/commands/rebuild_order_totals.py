@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart.totals import refresh_order_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute every order's stored total and item count from its items."
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = refresh_order_totals()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {written} orders in {elapsed:.2f}s."))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_order_customer_date_index'),
+        ('products', '0014_copurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='cart.cart')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='products.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['variant', 'expires_at'], name='stock_hold_variant_idx'), models.Index(fields=['expires_at'], name='stock_hold_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart', 'variant'), name='unique_stock_hold')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('cart', 'Order')
+    OrderItem = apps.get_model('cart', 'OrderItem')
+    items = OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+    Order.objects.update(
+        total=Coalesce(Subquery(items.annotate(
+            total=Sum((F('unit_price') - F('discount')) * F('quantity'))
+        ).values('total')), Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        item_count=Coalesce(Subquery(items.annotate(
+            count=Sum('quantity')
+        ).values('count')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'total'], name='order_customer_total_idx'),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
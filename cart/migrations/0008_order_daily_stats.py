@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_order_daily_stats(apps, schema_editor):
+    Order = apps.get_model('cart', 'Order')
+    OrderDailyStats = apps.get_model('cart', 'OrderDailyStats')
+    rows = Order.objects.annotate(day=TruncDate('date')).values('customer_id', 'day', 'status')
+    for group in (['customer_id', 'day', 'status'], ['day', 'status']):
+        OrderDailyStats.objects.bulk_create([
+            OrderDailyStats(**row)
+            for row in rows.values(*group).annotate(order_count=Count('id'), revenue=Sum('total')).order_by()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0007_order_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'order daily stats',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('customer__isnull', False)), fields=('customer', 'day', 'status'), name='unique_customer_order_stats'), models.UniqueConstraint(condition=models.Q(('customer__isnull', True)), fields=('day', 'status'), name='unique_store_order_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_order_daily_stats, migrations.RunPython.noop),
+    ]
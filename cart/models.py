@@ -1,8 +1,15 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models.sql import Query
 from django.conf import settings
+from django.utils import timezone
 from products.models import Product, ProductVariant
 
 
+# Session entry holding an anonymous visitor's cart key. Anonymous carts are
+# keyed by this token rather than the session key, so they survive the key
+# change at login and work with cookie-backed sessions.
+CART_SESSION_KEY = 'cart_key'
+
  
 # CART & CART ITEMS
 class Cart(models.Model):
@@ -25,11 +32,58 @@ class Cart(models.Model):
         return f"Cart {self.id}"
 
     def get_total(self):
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.get_priced().total
+
+    def get_priced(self):
+        """The cart's ``PricedCart``, priced on first use."""
+        if not hasattr(self, 'priced'):
+            from .pricing import price_cart
+            price_cart(self)
+        return self.priced
 
     def clear(self):
         self.items.all().delete()
 
+    def touch(self):
+        """
+        Mark the cart as used now. Item changes only write ``CartItem`` rows,
+        so the views call this to keep ``updated_at`` (which the abandoned
+        cart purge goes by) current.
+        """
+        self.updated_at = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+
+    def merge_items_from(self, other):
+        """
+        Add every line of ``other`` to this cart, summing quantities of lines
+        both carts hold. One ``INSERT ... SELECT ... ON CONFLICT`` per target
+        type upserts against ``unique_cart_product`` / ``unique_cart_variant``,
+        so the merge costs two statements whatever the size of the cart.
+        """
+        table = connection.ops.quote_name(CartItem._meta.db_table)
+        for name in ("unique_cart_product", "unique_cart_variant"):
+            constraint = next(c for c in CartItem._meta.constraints if c.name == name)
+            columns = [
+                connection.ops.quote_name(CartItem._meta.get_field(field).column)
+                for field in constraint.fields
+            ]
+            target = columns[-1]
+            # The conflict target must repeat the partial index's condition
+            # exactly, so render it from the constraint itself.
+            query = Query(model=CartItem, alias_cols=False)
+            condition, params = query.build_where(constraint.condition).as_sql(
+                query.get_compiler(connection=connection), connection
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} (cart_id, {target}, quantity, added_at) "
+                    f"SELECT %s, {target}, quantity, added_at FROM {table} "
+                    f"WHERE cart_id = %s AND {condition} "
+                    f"ON CONFLICT ({', '.join(columns)}) WHERE {condition} "
+                    f"DO UPDATE SET quantity = {table}.quantity + excluded.quantity",
+                    [self.pk, other.pk, *params, *params],
+                )
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
@@ -61,14 +115,41 @@ class CartItem(models.Model):
 
     def get_unit_price(self):
         """Return unit price with discounts."""
-        target = self.product_variant.product if self.product_variant else self.product
-        return target.get_discounted_price()
+        if not hasattr(self, 'unit_price'):
+            from .pricing import price_items
+            price_items([self])
+        return self.unit_price
 
     def get_subtotal(self):
         return self.get_unit_price() * self.quantity
 
 
  
+# STOCK HOLDS
+class StockHold(models.Model):
+    """
+    Variant stock set aside for a cart between the start of checkout and
+    ``expires_at``; see ``cart.stock``.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="stock_holds")
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="stock_holds")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "variant"], name="unique_stock_hold"),
+        ]
+        indexes = [
+            models.Index(fields=["variant", "expires_at"], name="stock_hold_variant_idx"),
+            models.Index(fields=["expires_at"], name="stock_hold_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant} held for {self.cart} until {self.expires_at}"
+
+
+ 
 # ORDER & ORDER ITEMS
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -92,12 +173,22 @@ class Order(models.Model):
         choices=STATUS_CHOICES,
         default="unconfirmed"
     )
+    # Sum of the items' subtotals and quantities, written at checkout and
+    # kept current by cart.totals (see refresh_order_totals).
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', '-date'], name='order_customer_date_idx'),
+            models.Index(fields=['customer', 'total'], name='order_customer_total_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.customer.username}"
 
     def get_total(self):
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.total
 
 
 class OrderItem(models.Model):
@@ -120,6 +211,63 @@ class OrderItem(models.Model):
 
 
  
+# ORDER ANALYTICS ROLLUPS
+class OrderDailyStats(models.Model):
+    """
+    Orders placed on one day (in the site's time zone) that are now in one
+    status: their count and revenue, for one customer or, with no customer,
+    for the whole store. Kept current by ``cart.rollups``.
+    """
+    customer = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "day", "status"],
+                name="unique_customer_order_stats",
+                condition=models.Q(customer__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=["day", "status"],
+                name="unique_store_order_stats",
+                condition=models.Q(customer__isnull=True),
+            ),
+        ]
+        verbose_name_plural = "order daily stats"
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.order_count} orders"
+
+
+ 
+# CHECKOUT IDEMPOTENCY KEYS
+class IdempotencyKey(models.Model):
+    """
+    A checkout form's one-time token and the order it produced, so that a
+    retried ``process_order`` POST replays the first result instead of
+    placing a second order. Purged after ``IDEMPOTENCY_KEY_TTL``.
+    """
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["customer", "key"], name="unique_idempotency_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> {self.order_id}"
+
+
+ 
 # SAVED ITEMS (Wishlist)
 class SavedItem(models.Model):
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="saved_items")
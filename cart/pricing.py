@@ -0,0 +1,86 @@
+"""
+Cart pricing.
+
+``price_carts`` loads the items of one or more carts with their products
+and variants joined and prices every line in one ``price_products`` batch,
+so pricing a cart costs the same handful of queries whatever its size. Each
+cart gets a ``priced`` attribute holding its ``PricedCart``, which
+``Cart.get_total``, ``CartItem.get_subtotal`` and the cart admin read
+instead of pricing the cart again.
+"""
+from products.pricing import price_products
+
+from .models import CartItem
+
+
+def item_product(item):
+    """Return the product a cart item prices against."""
+    if item.product_variant_id:
+        return item.product_variant.product
+    return item.product
+
+
+def price_items(items):
+    """
+    Set ``list_price``, ``unit_price`` (discounted) and ``subtotal`` on cart
+    ``items`` in one batch.
+    """
+    items = list(items)
+    prices = price_products({item_product(item) for item in items})
+    for item in items:
+        product = item_product(item)
+        item.list_price = product.price
+        item.unit_price = prices[product.pk]
+        item.subtotal = item.unit_price * item.quantity
+    return items
+
+
+class PricedCart:
+    """A cart's priced lines, with their subtotals and the grand total."""
+
+    def __init__(self, cart, items):
+        self.cart = cart
+        self.items = items
+        self.total = sum((item.subtotal for item in items), 0)
+        self.quantity = sum(item.quantity for item in items)
+        self._by_pk = {item.pk: item for item in items}
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def line(self, item):
+        """The priced line of ``item``, or ``None`` if it is not in the cart."""
+        return self._by_pk.get(item.pk)
+
+
+def price_carts(carts):
+    """
+    Price ``carts`` with one query for all of their items plus one pricing
+    batch, set ``priced`` on each and return the ``PricedCart`` list.
+    """
+    carts = list(carts)
+    items = {cart.pk: [] for cart in carts}
+    lines = (
+        CartItem.objects.filter(cart__in=[cart for cart in carts if cart.pk])
+        .select_related('product', 'product_variant__product')
+        .order_by('pk')
+    )
+    for item in price_items(lines):
+        items[item.cart_id].append(item)
+
+    for cart in carts:
+        for item in items[cart.pk]:
+            item.cart = cart
+        cart.priced = PricedCart(cart, items[cart.pk])
+    return [cart.priced for cart in carts]
+
+
+def price_cart(cart):
+    """Price a single cart; see ``price_carts``."""
+    return price_carts([cart])[0]
@@ -0,0 +1,143 @@
+"""
+Order analytics rollups.
+
+``OrderDailyStats`` holds, per day and status, how many orders were placed
+and their revenue: one row per customer and one store-wide row (no
+customer). ``cart.signals`` applies each order change as an ``F()`` delta in
+the order's own transaction, ``refresh_order_totals`` does the same when an
+order's stored total moves, and ``rebuild_rollups`` recomputes every row
+from the orders (``rebuild_order_rollups``).
+
+Charts read the daily rows: ``status_counts`` sums them by status and
+``order_series`` folds one year of them into daily, weekly and monthly
+points, so neither scans order history.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderDailyStats
+
+# The part of an order the rollups depend on.
+OrderState = namedtuple('OrderState', 'customer_id day status total')
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def order_state(order):
+    """The ``OrderState`` of ``order``, which must have its date set."""
+    return OrderState(order.customer_id, timezone.localdate(order.date), order.status, order.total)
+
+
+def _bump(customer_id, day, status, count, revenue):
+    rows = OrderDailyStats.objects.filter(customer_id=customer_id, day=day, status=status)
+    changes = {'order_count': F('order_count') + count, 'revenue': F('revenue') + revenue}
+    if rows.update(**changes) or count < 0:
+        # Nothing to take away from a row that was never written (or went
+        # with its customer).
+        return
+    try:
+        with transaction.atomic():
+            OrderDailyStats.objects.create(
+                customer_id=customer_id, day=day, status=status, order_count=count, revenue=revenue
+            )
+    except IntegrityError:
+        # A concurrent order created the row first.
+        rows.update(**changes)
+
+
+def _apply(state, sign, count=1):
+    for customer_id in (state.customer_id, None):
+        _bump(customer_id, state.day, state.status, sign * count, sign * state.total)
+
+
+def apply_order_change(previous, current):
+    """
+    Move an order from ``previous`` to ``current`` (either an ``OrderState``,
+    or ``None`` for an order being created or deleted) in the rollups.
+    """
+    if previous == current:
+        return
+    if previous and current and previous[:3] == current[:3]:
+        # Same rows; only the revenue moves.
+        _apply(current._replace(total=current.total - previous.total), 1, count=0)
+        return
+    if previous:
+        _apply(previous, -1)
+    if current:
+        _apply(current, 1)
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from the orders; return how many were written."""
+    rows = (
+        Order.objects.annotate(day=TruncDate('date'))
+        .values('customer_id', 'day', 'status')
+        .annotate(order_count=Count('id'), revenue=Sum('total'))
+        .order_by()
+    )
+    stats = []
+    store = {}
+    for row in rows:
+        stats.append(OrderDailyStats(**row))
+        key = (row['day'], row['status'])
+        total = store.setdefault(key, OrderDailyStats(day=row['day'], status=row['status']))
+        total.order_count += row['order_count']
+        total.revenue += row['revenue']
+    stats.extend(store.values())
+
+    with transaction.atomic():
+        OrderDailyStats.objects.all().delete()
+        OrderDailyStats.objects.bulk_create(stats, batch_size=REBUILD_BATCH_SIZE)
+    return len(stats)
+
+
+def _rows(customer):
+    if customer is None:
+        return OrderDailyStats.objects.filter(customer__isnull=True)
+    return OrderDailyStats.objects.filter(customer=customer)
+
+
+def status_counts(customer=None):
+    """Map each status to the number of orders of ``customer`` (or the store) in it."""
+    rows = _rows(customer).values('status').annotate(count=Sum('order_count')).order_by()
+    return {row['status']: row['count'] for row in rows if row['count']}
+
+
+def order_series(customer=None, today=None):
+    """
+    Order counts and revenue of ``customer`` (or the store) per day over the
+    last 30 days, per week over the last 12 weeks and per month over the
+    last year, as ``{'daily': [...], 'weekly': [...], 'monthly': [...]}``
+    lists of ``{'day'|'week'|'month': date, 'count': n, 'revenue': amount}``.
+    Weeks start on Monday; all three come from one query.
+    """
+    today = today or timezone.localdate()
+    days = (
+        _rows(customer).filter(day__gt=today - timedelta(days=365))
+        .values('day')
+        .annotate(count=Sum('order_count'), revenue=Sum('revenue'))
+        .filter(count__gt=0)
+        .order_by('day')
+    )
+    series = {'daily': [], 'weekly': [], 'monthly': []}
+    periods = [
+        ('daily', 'day', today - timedelta(days=30), lambda day: day),
+        ('weekly', 'week', today - timedelta(weeks=12), lambda day: day - timedelta(days=day.weekday())),
+        ('monthly', 'month', today - timedelta(days=365), lambda day: day.replace(day=1)),
+    ]
+    for row in days:
+        for name, key, since, start in periods:
+            if row['day'] < since:
+                continue
+            points = series[name]
+            if points and points[-1][key] == start(row['day']):
+                points[-1]['count'] += row['count']
+                points[-1]['revenue'] += row['revenue']
+            else:
+                points.append({key: start(row['day']), 'count': row['count'], 'revenue': row['revenue']})
+    return series
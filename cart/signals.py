@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Order
+from .rollups import apply_order_change, order_state
+
+
+# ORDER ANALYTICS ROLLUPS
+# Applied immediately rather than on commit, so the rollup rows change in
+# the same transaction as the order.
+@receiver(pre_save, sender=Order)
+def order_pre_save(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if not raw and instance.pk:
+        previous = (
+            Order.objects.filter(pk=instance.pk)
+            .only('customer_id', 'date', 'status', 'total')
+            .first()
+        )
+        if previous:
+            instance._previous_state = order_state(previous)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        apply_order_change(getattr(instance, '_previous_state', None), order_state(instance))
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    apply_order_change(order_state(instance), None)
@@ -0,0 +1,147 @@
+"""
+Variant stock reservation.
+
+Starting checkout reserves the cart's variant lines (``reserve_stock``) as
+``StockHold`` rows that expire after ``HOLD_TTL``; other shoppers see that
+stock as taken until the hold lapses. ``process_order`` then commits the
+lines (``commit_stock``) with one conditional ``UPDATE`` across every
+variant, decrementing ``stock`` only where it still covers the line plus
+everything other carts hold, so concurrent checkouts of the same SKU can
+never oversell or lose an update: whichever ``UPDATE`` runs second sees the
+first one's result. Expired holds are ignored everywhere and deleted in
+bulk by ``reap_holds``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import ProductVariant
+
+from .models import StockHold
+
+HOLD_TTL = timedelta(seconds=getattr(settings, 'STOCK_HOLD_TTL', 60 * 10))
+
+REAP_BATCH_SIZE = 1000
+
+
+class OutOfStock(Exception):
+    """Raised with ``{variant_id: quantity still available}`` for short lines."""
+
+    def __init__(self, available):
+        self.available = available
+        super().__init__(f"Not enough stock for variants {sorted(available)}")
+
+
+def variant_quantities(lines):
+    """Map variant id to the quantity of cart ``lines`` that hold variants."""
+    quantities = {}
+    for line in lines:
+        if line.product_variant_id:
+            quantities[line.product_variant_id] = quantities.get(line.product_variant_id, 0) + line.quantity
+    return quantities
+
+
+def _held_by_others(cart, now):
+    """Subquery: units of ``OuterRef('pk')`` held by carts other than ``cart``."""
+    holds = StockHold.objects.filter(variant=OuterRef('pk'), expires_at__gt=now)
+    if cart is not None and cart.pk is not None:
+        holds = holds.exclude(cart_id=cart.pk)
+    holds = (
+        holds.values('variant')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(holds, output_field=IntegerField()), Value(0))
+
+
+def available_stock(variant_ids, cart=None, now=None):
+    """
+    Map each variant id to its stock minus what other carts hold, in one
+    query. Holds of ``cart`` itself do not count against it.
+    """
+    now = now or timezone.now()
+    rows = ProductVariant.objects.filter(pk__in=variant_ids).annotate(
+        available=F('stock') - _held_by_others(cart, now)
+    ).values_list('pk', 'available')
+    return {pk: max(available, 0) for pk, available in rows}
+
+
+def _check(quantities, available):
+    short = {
+        pk: available.get(pk, 0)
+        for pk, quantity in quantities.items()
+        if available.get(pk, 0) < quantity
+    }
+    if short:
+        raise OutOfStock(short)
+
+
+def reserve_stock(cart, lines, now=None):
+    """
+    Hold stock for the variant ``lines`` of ``cart`` until ``HOLD_TTL`` from
+    now, replacing any earlier holds of the cart. Raises ``OutOfStock``
+    (holding nothing) when other carts' holds leave too little.
+    """
+    now = now or timezone.now()
+    quantities = variant_quantities(lines)
+    with transaction.atomic():
+        StockHold.objects.filter(cart=cart).delete()
+        if not quantities:
+            return
+        # Lock the variants (in a fixed order) so concurrent reservations
+        # of the same SKU queue up instead of both seeing the same stock.
+        locked = ProductVariant.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+        list(locked.values_list('pk'))
+        _check(quantities, available_stock(quantities, cart, now))
+        StockHold.objects.bulk_create([
+            StockHold(cart=cart, variant_id=pk, quantity=quantity, expires_at=now + HOLD_TTL)
+            for pk, quantity in quantities.items()
+        ])
+
+
+def commit_stock(cart, lines, now=None):
+    """
+    Take the variant ``lines`` of ``cart`` out of stock and release its
+    holds. One ``UPDATE`` decrements every variant whose stock covers the
+    line and other carts' holds; if any variant falls short, ``OutOfStock``
+    is raised and the caller's transaction must roll back.
+    """
+    now = now or timezone.now()
+    quantities = variant_quantities(lines)
+    if quantities:
+        needed = Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        )
+        try:
+            with transaction.atomic():
+                updated = (
+                    ProductVariant.objects.filter(pk__in=quantities)
+                    .alias(needed=needed, held=_held_by_others(cart, now))
+                    .filter(stock__gte=F('needed') + F('held'))
+                    .update(stock=F('stock') - needed)
+                )
+                if updated != len(quantities):
+                    raise OutOfStock({})
+        except OutOfStock:
+            # The savepoint undid the variants that were decremented, so
+            # the shortfall can be reported against current stock.
+            _check(quantities, available_stock(quantities, cart, now))
+            raise
+    StockHold.objects.filter(cart=cart).delete()
+
+
+def reap_holds(batch_size=REAP_BATCH_SIZE, now=None):
+    """Delete expired holds in batches; return how many were deleted."""
+    now = now or timezone.now()
+    expired = StockHold.objects.filter(expires_at__lte=now)
+    reaped = 0
+    while True:
+        batch = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return reaped
+        reaped += StockHold.objects.filter(pk__in=batch).delete()[0]
@@ -1,9 +1,27 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.utils import timezone
+from io import StringIO
+from unittest import mock
+import json
+import threading
+import time
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.contrib.messages import get_messages
-from .models import Cart, CartItem, Order, OrderItem
-from products.models import Product, ProductVariant
+from .models import CART_SESSION_KEY, Cart, CartItem, IdempotencyKey, Order, OrderDailyStats, OrderItem, StockHold
+from .cleanup import MAX_AGE
+from .pricing import price_cart, price_carts
+from .rollups import order_series, rebuild_rollups, status_counts
+from .stock import HOLD_TTL, OutOfStock, available_stock, commit_stock, reserve_stock
+from .totals import refresh_order_totals
+from products.models import Brand, Discount, Product, ProductVariant
+from datetime import date, timedelta
 from decimal import Decimal
 
 User = get_user_model()
@@ -121,8 +139,10 @@ class CartViewsTestCase(TestCase):
     def test_anonymous_cart_merge(self):
         # Add item to anonymous cart
         session = self.client.session
-        session.create()
-        cart = Cart.objects.create(session_key=session.session_key)
+        session[CART_SESSION_KEY] = 'anonymous-cart'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        cart = Cart.objects.create(session_key='anonymous-cart')
         CartItem.objects.create(cart=cart, product=self.product, quantity=1)
         
         # Login and check merge
@@ -131,3 +151,965 @@ class CartViewsTestCase(TestCase):
         
         user_cart = Cart.objects.get(customer=self.user)
         self.assertEqual(user_cart.items.count(), 1)
+
+
+class CartPricingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pricinguser', email='pricing@example.com', password='testpass')
+        self.brand = Brand.objects.create(name='Pricing Brand')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', brand=self.brand, price=Decimal('10.00') * (i + 1))
+            for i in range(30)
+        ]
+        discount = Discount.objects.create(
+            name='Half off', discount_type=Discount.PERCENTAGE, value=Decimal('50'),
+            start_date=date.today() - timedelta(days=1),
+        )
+        discount.products.add(self.products[0])
+        self.cart = Cart.objects.create(customer=self.user)
+        for product in self.products[:20]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        for product in self.products[20:]:
+            variant = ProductVariant.objects.create(product=product, size='M', color='RED')
+            CartItem.objects.create(cart=self.cart, product_variant=variant, quantity=1)
+
+    def test_price_cart(self):
+        priced = price_cart(self.cart)
+        self.assertEqual(len(priced), 30)
+        self.assertEqual(priced.quantity, 50)
+        first = priced.items[0]
+        self.assertEqual(first.unit_price, Decimal('5.00'))
+        self.assertEqual(first.subtotal, Decimal('10.00'))
+        expected = sum(p.price * 2 for p in self.products[1:20]) + sum(p.price for p in self.products[20:])
+        self.assertEqual(priced.total, expected + Decimal('10.00'))
+        self.assertEqual(self.cart.get_total(), priced.total)
+
+    def test_price_cart_query_count(self):
+        # Items, active discounts and their three target tables.
+        with self.assertNumQueries(5):
+            priced = price_cart(self.cart)
+        with self.assertNumQueries(0):
+            for item in priced:
+                item.get_subtotal()
+                (item.product_variant.product if item.product_variant else item.product).name
+            self.cart.get_total()
+
+    def test_price_carts(self):
+        other = Cart.objects.create(session_key='anonymous')
+        CartItem.objects.create(cart=other, product=self.products[0], quantity=3)
+        empty = Cart.objects.create(session_key='empty')
+        with self.assertNumQueries(5):
+            priced = price_carts([self.cart, other, empty])
+        self.assertEqual(priced[1].total, Decimal('15.00'))
+        self.assertEqual(priced[2].total, 0)
+        self.assertFalse(priced[2])
+
+    def test_item_subtotal_without_cart(self):
+        item = self.cart.items.get(product=self.products[0])
+        self.assertEqual(item.get_unit_price(), Decimal('5.00'))
+        self.assertEqual(item.get_subtotal(), Decimal('10.00'))
+
+    def test_cart_admin(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='testpass')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:cart_cart_changelist'))
+        self.assertContains(response, str(price_cart(self.cart).total))
+        response = self.client.get(reverse('admin:cart_cart_change', args=[self.cart.pk]))
+        self.assertContains(response, '5.00')
+
+
+class AnonymousCartTestCase(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name='Anonymous Brand')
+        self.product = Product.objects.create(
+            name='Anonymous Product', brand=brand, price=Decimal('20.00'), image='products/anonymous.jpg'
+        )
+
+    def test_browsing_creates_no_session_or_cart(self):
+        for url in [reverse('dashboard'), reverse('all_products_list'), reverse('cart_detail')]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Cart.objects.exists())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_browsing_writes_no_database_session(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('cart_detail'))
+        self.assertFalse(Session.objects.exists())
+
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_add_to_cart_starts_session(self):
+        response = self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        cart = Cart.objects.get()
+        self.assertEqual(cart.session_key, self.client.session[CART_SESSION_KEY])
+
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 1})
+        self.assertEqual(Cart.objects.get().items.get().quantity, 3)
+        response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(response.context['cart_items_count'], 3)
+        self.assertEqual(response.context['total_price'], Decimal('60.00'))
+
+    def test_cart_merges_on_login(self):
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        user = User.objects.create_user(username='merger', email='merger@example.com', password='testpass')
+        self.client.force_login(user)
+
+        self.client.get(reverse('cart_detail'))
+        self.assertEqual(Cart.objects.get().customer, user)
+        self.assertEqual(user.cart.items.get().quantity, 2)
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+
+
+class CartCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Count Brand')
+        self.product = Product.objects.create(
+            name='Count Product', brand=brand, price=Decimal('20.00'), image='products/count.jpg'
+        )
+        self.variant = ProductVariant.objects.create(product=self.product, size='M', color='RED', stock=10)
+        self.user = User.objects.create_user(username='counter', email='counter@example.com', password='testpass')
+
+    def navbar_count(self):
+        """Render a page and return its badge count and the cart queries it ran."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        cart_queries = [q['sql'] for q in queries.captured_queries if '"cart_cart' in q['sql']]
+        return response.context['cart_items_count'], cart_queries
+
+    def test_count_follows_cart_changes(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.navbar_count()[0], 0)
+
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        self.client.post(reverse('add_to_cart'), {'product_variant_id': self.variant.id, 'quantity': 3})
+        self.assertEqual(self.navbar_count(), (5, []))
+
+        item = CartItem.objects.get(product=self.product)
+        self.client.post(reverse('update_cart_item', args=[item.id]), {'quantity': 4})
+        self.assertEqual(self.navbar_count(), (7, []))
+
+        self.client.post(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(self.navbar_count(), (3, []))
+
+        self.client.post(reverse('clear_cart'))
+        self.assertEqual(self.navbar_count(), (0, []))
+
+    def test_count_after_order(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        self.client.post(reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'})
+        self.assertEqual(self.navbar_count(), (0, []))
+
+    def test_count_on_cache_miss(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        cache.clear()
+        count, cart_queries = self.navbar_count()
+        self.assertEqual(count, 2)
+        self.assertEqual(len(cart_queries), 1)
+        self.assertEqual(self.navbar_count(), (2, []))
+
+    def test_anonymous_count_and_merge(self):
+        self.client.post(reverse('add_to_cart'), {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(self.navbar_count(), (2, []))
+
+        cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=cart, product_variant=self.variant, quantity=1)
+        self.client.force_login(self.user)
+        self.client.get(reverse('cart_detail'))
+        self.assertEqual(self.navbar_count(), (3, []))
+
+
+class CartMergeTestCase(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name='Merge Brand')
+        self.products = [
+            Product.objects.create(name=f'Merge {i}', brand=brand, price=Decimal('10.00')) for i in range(4)
+        ]
+        self.variants = [
+            ProductVariant.objects.create(product=product, size='M', color='RED') for product in self.products
+        ]
+        self.user = User.objects.create_user(username='merge', email='merge@example.com', password='testpass')
+        self.cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=self.cart, product_variant=self.variants[0], quantity=1)
+
+        self.anonymous = Cart.objects.create(session_key='merge-key')
+        for product, variant in zip(self.products, self.variants):
+            CartItem.objects.create(cart=self.anonymous, product=product, quantity=2)
+            CartItem.objects.create(cart=self.anonymous, product_variant=variant, quantity=3)
+
+    def quantities(self):
+        return {
+            (item.product_id, item.product_variant_id): item.quantity
+            for item in self.cart.items.all()
+        }
+
+    def test_merge_items_from(self):
+        with self.assertNumQueries(2):
+            self.cart.merge_items_from(self.anonymous)
+        quantities = self.quantities()
+        self.assertEqual(len(quantities), 8)
+        self.assertEqual(quantities[(self.products[0].pk, None)], 3)
+        self.assertEqual(quantities[(None, self.variants[0].pk)], 4)
+        self.assertEqual(quantities[(self.products[3].pk, None)], 2)
+        self.assertEqual(quantities[(None, self.variants[3].pk)], 3)
+
+    def test_merge_on_login(self):
+        session = self.client.session
+        session[CART_SESSION_KEY] = 'merge-key'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        self.client.force_login(self.user)
+
+        self.client.get(reverse('cart_detail'))
+        self.assertFalse(Cart.objects.filter(pk=self.anonymous.pk).exists())
+        self.assertEqual(sum(self.quantities().values()), 22)
+
+    def test_merge_is_idempotent(self):
+        from .views import _merge_anonymous_cart
+        _merge_anonymous_cart(self.cart, 'merge-key')
+        _merge_anonymous_cart(self.cart, 'merge-key')
+        self.assertEqual(sum(self.quantities().values()), 22)
+        self.assertEqual(CartItem.objects.count(), 8)
+
+    def test_second_merge_finds_nothing_to_claim(self):
+        from .views import _merge_anonymous_cart
+        # Another login claimed the cart (re-keyed it) but has not merged yet.
+        Cart.objects.filter(pk=self.anonymous.pk).update(session_key='claimed-elsewhere')
+        with mock.patch.object(Cart, 'merge_items_from') as merge:
+            _merge_anonymous_cart(self.cart, 'merge-key')
+        merge.assert_not_called()
+        self.assertTrue(Cart.objects.filter(pk=self.anonymous.pk).exists())
+        self.assertEqual(sum(self.quantities().values()), 2)
+
+
+class BulkAddToCartTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Bulk Brand')
+        self.products = [
+            Product.objects.create(
+                name=f'Bulk {i}', brand=brand, price=Decimal('10.00') + i, image=f'products/bulk_{i}.jpg'
+            )
+            for i in range(20)
+        ]
+        self.variants = [
+            ProductVariant.objects.create(product=product, size='M', color='RED', stock=10) for product in self.products
+        ]
+        self.user = User.objects.create_user(username='bulk', email='bulk@example.com', password='testpass')
+        self.client.force_login(self.user)
+
+    def add_many(self, lines):
+        return self.client.post(
+            reverse('add_many_to_cart'), json.dumps({'lines': lines}), content_type='application/json'
+        )
+
+    def test_add_many(self):
+        cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+
+        response = self.add_many([
+            {'product_id': self.products[0].pk, 'quantity': 2},
+            {'product_id': self.products[1].pk},
+            {'product_variant_id': self.variants[0].pk, 'quantity': 3},
+            {'product_variant_id': self.variants[0].pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            {(item['product_id'], item['product_variant_id']): item['quantity'] for item in data['items']},
+            {(self.products[0].pk, None): 3, (self.products[1].pk, None): 1, (None, self.variants[0].pk): 4},
+        )
+        self.assertEqual(data['item_count'], 8)
+        self.assertEqual(Decimal(data['total']), Decimal('10.00') * 3 + Decimal('11.00') + Decimal('10.00') * 4)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['cart_items_count'], 8)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        with CaptureQueriesContext(connection) as few:
+            self.add_many([{'product_id': self.products[0].pk}, {'product_variant_id': self.variants[0].pk}])
+        with CaptureQueriesContext(connection) as many:
+            self.add_many(
+                [{'product_id': product.pk} for product in self.products]
+                + [{'product_variant_id': variant.pk, 'quantity': 2} for variant in self.variants]
+            )
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(CartItem.objects.count(), 40)
+        self.assertEqual(CartItem.objects.get(product=self.products[0]).quantity, 3)
+
+    def test_unknown_ids_add_nothing(self):
+        response = self.add_many([{'product_id': self.products[0].pk}, {'product_variant_id': 9999}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['missing'], {'product_id': [], 'product_variant_id': [9999]})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_invalid_payloads(self):
+        for lines in [
+            [],
+            [{'quantity': 1}],
+            [{'product_id': self.products[0].pk, 'product_variant_id': self.variants[0].pk}],
+            [{'product_id': self.products[0].pk, 'quantity': 0}],
+            [{'product_id': str(self.products[0].pk)}],
+        ]:
+            self.assertEqual(self.add_many(lines).status_code, 400, lines)
+        response = self.client.post(reverse('add_many_to_cart'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_anonymous_add_many(self):
+        self.client.logout()
+        response = self.add_many([{'product_id': self.products[0].pk, 'quantity': 2}])
+        self.assertEqual(response.json()['item_count'], 2)
+        self.assertEqual(Cart.objects.get().session_key, self.client.session[CART_SESSION_KEY])
+
+
+class PurgeAbandonedCartsTestCase(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name='Purge Brand')
+        product = Product.objects.create(name='Purge Product', brand=brand, price=Decimal('10.00'))
+        user = User.objects.create_user(username='purge', email='purge@example.com', password='testpass')
+        old = timezone.now() - timedelta(days=30)
+
+        self.abandoned = [Cart.objects.create(session_key=f'old-{i}') for i in range(7)]
+        self.recent = Cart.objects.create(session_key='recent')
+        self.customer_cart = Cart.objects.create(customer=user)
+        for cart in self.abandoned + [self.recent, self.customer_cart]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        Cart.objects.filter(pk__in=[cart.pk for cart in self.abandoned] + [self.customer_cart.pk]).update(updated_at=old)
+
+    def test_purge(self):
+        out = StringIO()
+        call_command('purge_abandoned_carts', batch_size=3, stdout=out)
+        self.assertIn('Deleted 7 abandoned carts and 7 items in 3 batches', out.getvalue())
+        self.assertEqual(set(Cart.objects.all()), {self.recent, self.customer_cart})
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('purge_abandoned_carts', dry_run=True, stdout=out)
+        self.assertIn('Would delete 7 abandoned carts and 7 items', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 9)
+
+    def test_cart_changes_keep_cart(self):
+        session = self.client.session
+        session[CART_SESSION_KEY] = 'old-0'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        item = self.abandoned[0].items.get()
+        self.client.post(reverse('update_cart_item', args=[item.pk]), {'quantity': 2})
+
+        call_command('purge_abandoned_carts', stdout=StringIO())
+        self.assertTrue(Cart.objects.filter(pk=self.abandoned[0].pk).exists())
+        self.assertEqual(Cart.objects.count(), 3)
+
+    def test_live_session_keeps_cart(self):
+        session = self.client.session
+        session[CART_SESSION_KEY] = 'old-1'
+        session.save()
+
+        out = StringIO()
+        call_command('purge_abandoned_carts', stdout=out)
+        self.assertIn('Deleted 6 abandoned carts', out.getvalue())
+        self.assertTrue(Cart.objects.filter(pk=self.abandoned[1].pk).exists())
+
+        Session.objects.update(expire_date=timezone.now() - timedelta(seconds=1))
+        call_command('purge_abandoned_carts', stdout=StringIO())
+        self.assertFalse(Cart.objects.filter(pk=self.abandoned[1].pk).exists())
+
+    def test_max_age_follows_session_lifetime(self):
+        self.assertEqual(MAX_AGE, timedelta(seconds=settings.SESSION_COOKIE_AGE))
+
+    def test_days(self):
+        out = StringIO()
+        call_command('purge_abandoned_carts', days=60, stdout=out)
+        self.assertIn('Deleted 0 abandoned carts', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 9)
+
+
+class CheckoutTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Checkout Brand')
+        self.products = [
+            Product.objects.create(name=f'Checkout {i}', brand=brand, price=Decimal('40.00'))
+            for i in range(20)
+        ]
+        discount = Discount.objects.create(
+            name='Quarter off', discount_type=Discount.PERCENTAGE, value=Decimal('25'),
+            start_date=date.today() - timedelta(days=1),
+        )
+        discount.products.add(self.products[0])
+        self.user = User.objects.create_user(username='checkout', email='checkout@example.com', password='testpass')
+        self.cart = Cart.objects.create(customer=self.user)
+        self.client.force_login(self.user)
+
+    def fill_cart(self, products):
+        for product in products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def place_order(self):
+        return self.client.post(reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'})
+
+    def test_order_locks_in_discount(self):
+        self.fill_cart(self.products[:2])
+        variant = ProductVariant.objects.create(product=self.products[0], size='M', color='RED', stock=5)
+        CartItem.objects.create(cart=self.cart, product_variant=variant, quantity=1)
+        self.place_order()
+
+        order = Order.objects.get()
+        items = {(item.product_id, item.product_variant_id): item for item in order.items.all()}
+        discounted = items[(self.products[0].pk, None)]
+        self.assertEqual((discounted.unit_price, discounted.discount), (Decimal('40.00'), Decimal('10.00')))
+        self.assertEqual(items[(None, variant.pk)].discount, Decimal('10.00'))
+        self.assertEqual(items[(self.products[1].pk, None)].discount, 0)
+        self.assertEqual(order.get_total(), Decimal('30.00') * 3 + Decimal('40.00') * 2)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # The day's first order also creates its analytics rollup rows.
+        self.fill_cart(self.products[:1])
+        self.place_order()
+        self.fill_cart(self.products[:2])
+        with CaptureQueriesContext(connection) as few:
+            self.place_order()
+        self.fill_cart(self.products)
+        with CaptureQueriesContext(connection) as many:
+            self.place_order()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(OrderItem.objects.count(), 23)
+
+    def test_failed_checkout_leaves_nothing_behind(self):
+        self.fill_cart(self.products[:3])
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.place_order()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 3)
+
+    def test_empty_cart(self):
+        response = self.place_order()
+        self.assertRedirects(response, reverse('cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+def run_at_once(*requests):
+    """Call each of ``requests`` in its own thread, all at once; return the responses."""
+    barrier = threading.Barrier(len(requests))
+    responses = []
+
+    def run(request):
+        try:
+            barrier.wait()
+            responses.append(request())
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(request,)) for request in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Race Brand')
+        product = Product.objects.create(name='Race Product', brand=brand, price=Decimal('10.00'))
+        self.variant = ProductVariant.objects.create(product=product, size='M', color='RED', stock=3)
+        self.clients = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='testpass')
+            cart = Cart.objects.create(customer=user)
+            CartItem.objects.create(cart=cart, product_variant=self.variant, quantity=2)
+            client = Client()
+            client.force_login(user)
+            self.clients.append(client)
+
+    def test_concurrent_checkouts_take_turns(self):
+        def slow_price_cart(cart):
+            # Widen the window between reading the cart and writing stock.
+            priced = price_cart(cart)
+            time.sleep(0.2)
+            return priced
+
+        def checkout(client):
+            return lambda: client.post(
+                reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'}
+            )
+
+        with mock.patch('cart.views.price_cart', slow_price_cart):
+            responses = run_at_once(*[checkout(client) for client in self.clients])
+
+        self.assertEqual([response.status_code for response in responses], [302, 302])
+        self.assertEqual(Order.objects.count(), 1)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+
+
+class ConcurrentAddTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Race Brand')
+        self.product = Product.objects.create(name='Race Product', brand=brand, price=Decimal('10.00'))
+        user = User.objects.create_user(username='racer', email='racer@example.com', password='testpass')
+        self.cart = Cart.objects.create(customer=user)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.clients = [Client(), Client()]
+        for client in self.clients:
+            client.force_login(user)
+
+    def test_concurrent_adds_keep_both_quantities(self):
+        bulk_update = CartItem.objects.bulk_update
+
+        def slow_bulk_update(*args, **kwargs):
+            # Widen the window between reading the lines and writing them.
+            time.sleep(0.2)
+            return bulk_update(*args, **kwargs)
+
+        def add(client):
+            return lambda: client.post(
+                reverse('add_many_to_cart'),
+                json.dumps({'lines': [{'product_id': self.product.pk}]}),
+                content_type='application/json',
+            )
+
+        with mock.patch.object(CartItem.objects, 'bulk_update', slow_bulk_update):
+            responses = run_at_once(*[add(client) for client in self.clients])
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(self.cart.items.get().quantity, 3)
+
+
+class StockTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Stock Brand')
+        self.product = Product.objects.create(
+            name='Stock Product', brand=brand, price=Decimal('10.00'), image='products/stock.jpg'
+        )
+        self.variant = ProductVariant.objects.create(product=self.product, size='M', color='RED', stock=3)
+        self.sold_out = ProductVariant.objects.create(product=self.product, size='L', color='RED', stock=0)
+        self.user = User.objects.create_user(username='stock', email='stock@example.com', password='testpass')
+        self.cart = Cart.objects.create(customer=self.user)
+        self.other = Cart.objects.create(session_key='other')
+
+    def add(self, cart, variant, quantity):
+        CartItem.objects.create(cart=cart, product_variant=variant, quantity=quantity)
+        return list(cart.items.all())
+
+    def test_add_to_cart_checks_stock(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart'), {'product_variant_id': self.sold_out.id, 'quantity': 1})
+        self.client.post(reverse('add_to_cart'), {'product_variant_id': self.variant.id, 'quantity': 2})
+        self.client.post(reverse('add_to_cart'), {'product_variant_id': self.variant.id, 'quantity': 2})
+        self.assertEqual(list(self.cart.items.values_list('product_variant', 'quantity')), [(self.variant.pk, 2)])
+
+        response = self.client.post(
+            reverse('add_many_to_cart'),
+            json.dumps({'lines': [{'product_variant_id': self.variant.pk, 'quantity': 2}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available'], {str(self.variant.pk): 3})
+        self.assertEqual(self.cart.items.get().quantity, 2)
+
+    def test_holds_reduce_availability(self):
+        reserve_stock(self.other, self.add(self.other, self.variant, 2))
+        self.assertEqual(available_stock([self.variant.pk], self.cart), {self.variant.pk: 1})
+        self.assertEqual(available_stock([self.variant.pk], self.other), {self.variant.pk: 3})
+
+        with self.assertRaises(OutOfStock) as raised:
+            reserve_stock(self.cart, self.add(self.cart, self.variant, 2))
+        self.assertEqual(raised.exception.available, {self.variant.pk: 1})
+        self.assertFalse(StockHold.objects.filter(cart=self.cart).exists())
+
+        # Once the other cart's hold lapses, its stock is free again.
+        later = timezone.now() + HOLD_TTL + timedelta(seconds=1)
+        reserve_stock(self.cart, self.cart.items.all(), now=later)
+        self.assertEqual(StockHold.objects.get(cart=self.cart).quantity, 2)
+
+    def test_checkout_reserves_and_order_takes_stock(self):
+        self.add(self.cart, self.variant, 2)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 200)
+        self.assertEqual(StockHold.objects.get(cart=self.cart).quantity, 2)
+
+        self.client.post(reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'})
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+        self.assertTrue(Order.objects.exists())
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_order_fails_without_stock(self):
+        self.add(self.cart, self.variant, 2)
+        reserve_stock(self.other, self.add(self.other, self.variant, 2))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'})
+        self.assertRedirects(response, reverse('cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 1)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 3)
+
+    def test_commit_is_all_or_nothing(self):
+        other_variant = ProductVariant.objects.create(product=self.product, size='S', color='RED', stock=5)
+        self.add(self.cart, other_variant, 2)
+        lines = self.add(self.cart, self.variant, 4)
+        with self.assertRaises(OutOfStock) as raised:
+            commit_stock(self.cart, lines)
+        self.assertEqual(raised.exception.available, {self.variant.pk: 3})
+        other_variant.refresh_from_db()
+        self.assertEqual(other_variant.stock, 5)
+
+    def test_competing_commits_never_oversell(self):
+        other_variant = ProductVariant.objects.create(product=self.product, size='S', color='RED', stock=5)
+        self.add(self.cart, other_variant, 1)
+        first = self.add(self.cart, self.variant, 2)
+        second = self.add(self.other, self.variant, 2)
+        with CaptureQueriesContext(connection) as queries:
+            commit_stock(self.cart, first)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        with self.assertRaises(OutOfStock):
+            commit_stock(self.other, second)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+
+    def test_reap_stock_holds(self):
+        reserve_stock(self.other, self.add(self.other, self.variant, 1), now=timezone.now() - HOLD_TTL * 2)
+        reserve_stock(self.cart, self.add(self.cart, self.variant, 1))
+        out = StringIO()
+        call_command('reap_stock_holds', stdout=out)
+        self.assertIn('Reaped 1 expired stock holds', out.getvalue())
+        self.assertEqual(list(StockHold.objects.values_list('cart', flat=True)), [self.cart.pk])
+
+
+class IdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Retry Brand')
+        self.product = Product.objects.create(
+            name='Retry Product', brand=brand, price=Decimal('10.00'), image='products/retry.jpg'
+        )
+        self.user = User.objects.create_user(username='retry', email='retry@example.com', password='testpass')
+        self.cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.client.force_login(self.user)
+
+    def place_order(self, key):
+        return self.client.post(reverse('process_order'), {
+            'telephone': '0700000000', 'destination': 'Kampala', 'idempotency_key': key,
+        })
+
+    def test_checkout_form_carries_key(self):
+        response = self.client.get(reverse('checkout'))
+        self.assertContains(response, f'name="idempotency_key" value="{response.context["idempotency_key"]}"')
+
+    def test_retry_replays_first_result(self):
+        first = self.place_order('key-1')
+        with self.assertNumQueries(3):  # session, user, key lookup
+            retry = self.place_order('key-1')
+        self.assertEqual(retry.url, first.url)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().order, Order.objects.get())
+
+    def test_new_key_places_new_order(self):
+        self.place_order('key-1')
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.place_order('key-2')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_failed_attempt_stores_no_key(self):
+        self.cart.clear()
+        self.place_order('key-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_per_customer(self):
+        self.place_order('key-1')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        CartItem.objects.create(cart=Cart.objects.create(customer=other), product=self.product, quantity=1)
+        self.client.force_login(other)
+        self.place_order('key-1')
+        self.assertEqual(Order.objects.filter(customer=other).count(), 1)
+
+    def test_purge(self):
+        self.place_order('key-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.place_order('key-2')
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Purged 1 idempotency keys', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='Totals Brand')
+        self.products = [
+            Product.objects.create(
+                name=f'Totals Product {i}', brand=brand, price=Decimal('10.00') * (i + 1),
+                image=f'products/totals_{i}.jpg',
+            )
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(username='totals', email='totals@example.com', password='testpass')
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(customer=self.user, destination='Kampala', status='pending')
+            for product in self.products[:i + 1]:
+                OrderItem.objects.create(
+                    order=order, product=product, unit_price=product.price,
+                    discount=Decimal('1.00'), quantity=2,
+                )
+            self.orders.append(order)
+        refresh_order_totals()
+
+    def test_refresh(self):
+        totals = list(Order.objects.order_by('pk').values_list('total', 'item_count'))
+        self.assertEqual(totals, [
+            (Decimal('18.00'), 2), (Decimal('56.00'), 4), (Decimal('114.00'), 6),
+        ])
+
+    def test_checkout_stores_totals(self):
+        cart = Cart.objects.create(customer=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=3)
+        CartItem.objects.create(cart=cart, product=self.products[2], quantity=1)
+        self.client.force_login(self.user)
+        self.client.post(reverse('process_order'), {'telephone': '0700000000', 'destination': 'Kampala'})
+        order = Order.objects.latest('pk')
+        self.assertEqual((order.total, order.item_count), (Decimal('60.00'), 4))
+        self.assertEqual(order.get_total(), sum(item.get_subtotal() for item in order.items.all()))
+
+    def test_rebuild_command(self):
+        Order.objects.update(total=0, item_count=0)
+        out = StringIO()
+        call_command('rebuild_order_totals', stdout=out)
+        self.assertIn('Rebuilt totals for 3 orders', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=self.orders[2].pk).total, Decimal('114.00'))
+
+    def test_admin_inline_edit_refreshes_totals(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='testpass')
+        self.client.force_login(admin_user)
+        order = self.orders[1]
+        items = list(order.items.order_by('pk'))
+        data = {
+            'customer': self.user.pk, 'destination': 'Kampala', 'telephone': '', 'status': 'pending',
+            'items-TOTAL_FORMS': 2, 'items-INITIAL_FORMS': 2, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+        }
+        for i, item in enumerate(items):
+            data.update({f'items-{i}-id': item.pk, f'items-{i}-order': order.pk})
+            data.update({f'items-{i}-product': item.product_id, f'items-{i}-product_variant': ''})
+        data['items-1-DELETE'] = 'on'
+        response = self.client.post(reverse('admin:cart_order_change', args=[order.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal('18.00'), 2))
+
+    def test_admin_changelist(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='testpass')
+        self.client.force_login(admin_user)
+        url = reverse('admin:cart_order_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(10):
+            order = Order.objects.create(customer=self.user, destination='Kampala', status='pending')
+            OrderItem.objects.create(order=order, product=self.products[0], unit_price=Decimal('10.00'), quantity=1)
+        with self.assertNumQueries(len(few)):
+            self.client.get(url)
+
+        response = self.client.get(url, {'o': '-7'})
+        self.assertEqual(response.context['cl'].result_list[0], self.orders[2])
+
+    def test_order_list_sort_and_filter(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('order-list'), {'sort': 'total_desc'})
+        self.assertEqual(list(response.context['orders']), self.orders[::-1])
+        response = self.client.get(reverse('order-list'), {'min_total': '20', 'max_total': '100'})
+        self.assertEqual(list(response.context['orders']), [self.orders[1]])
+        self.assertContains(response, 'Ugx 56')
+
+        response = self.client.get(reverse('order-list'), {'min_total': '500', 'sort': 'bogus'})
+        self.assertContains(response, 'No orders match these filters.')
+        self.assertEqual(response.context['sort'], 'newest')
+        response = self.client.get(reverse('order-list'), {'min_total': 'abc'})
+        self.assertEqual(len(response.context['orders']), 3)
+
+
+class OrderRollupsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='rollups', email='rollups@example.com', password='testpass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        self.today = timezone.localdate()
+
+    def create_order(self, customer, total, status='pending'):
+        return Order.objects.create(customer=customer, destination='Kampala', status=status, total=Decimal(total))
+
+    def stats(self, customer=None):
+        rows = OrderDailyStats.objects.filter(customer=customer) if customer else OrderDailyStats.objects.filter(customer__isnull=True)
+        return {(row.day, row.status): (row.order_count, row.revenue) for row in rows if row.order_count}
+
+    def test_order_changes(self):
+        order = self.create_order(self.user, '20.00')
+        self.create_order(self.user, '5.00')
+        self.create_order(self.other, '7.50')
+        self.assertEqual(self.stats(self.user), {(self.today, 'pending'): (2, Decimal('25.00'))})
+        self.assertEqual(self.stats(), {(self.today, 'pending'): (3, Decimal('32.50'))})
+
+        order.status = 'shipped'
+        order.save()
+        self.assertEqual(self.stats(self.user), {
+            (self.today, 'pending'): (1, Decimal('5.00')),
+            (self.today, 'shipped'): (1, Decimal('20.00')),
+        })
+        self.assertEqual(status_counts(), {'pending': 2, 'shipped': 1})
+
+        order.delete()
+        self.assertEqual(self.stats(self.user), {(self.today, 'pending'): (1, Decimal('5.00'))})
+        self.assertEqual(self.stats(), {(self.today, 'pending'): (2, Decimal('12.50'))})
+
+    def test_total_refresh_moves_revenue(self):
+        order = self.create_order(self.user, '0.00')
+        brand = Brand.objects.create(name='Rollup Brand')
+        product = Product.objects.create(name='Rollup Product', brand=brand, price=Decimal('12.00'))
+        OrderItem.objects.create(order=order, product=product, unit_price=Decimal('12.00'), quantity=2)
+        refresh_order_totals([order.pk])
+        self.assertEqual(self.stats(self.user), {(self.today, 'pending'): (1, Decimal('24.00'))})
+        self.assertEqual(self.stats(), {(self.today, 'pending'): (1, Decimal('24.00'))})
+
+    def test_rebuild_matches_incremental(self):
+        for total in ('10.00', '15.00'):
+            self.create_order(self.user, total, status='delivered')
+        self.create_order(self.other, '3.00')
+        expected = (self.stats(self.user), self.stats(self.other), self.stats())
+        OrderDailyStats.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_order_rollups', stdout=out)
+        self.assertIn('Rebuilt 4 order rollup rows', out.getvalue())
+        self.assertEqual((self.stats(self.user), self.stats(self.other), self.stats()), expected)
+        self.assertEqual(rebuild_rollups(), 4)
+
+    def test_series(self):
+        today = date(2026, 3, 18)  # a Wednesday
+        for days_ago, count in [(0, 1), (1, 2), (3, 1), (40, 4), (400, 9)]:
+            OrderDailyStats.objects.create(
+                day=today - timedelta(days=days_ago), status='pending',
+                order_count=count, revenue=Decimal('10.00') * count,
+            )
+        OrderDailyStats.objects.create(day=today, status='shipped', order_count=1, revenue=Decimal('10.00'))
+        with self.assertNumQueries(1):
+            series = order_series(today=today)
+        self.assertEqual(
+            [(point['day'], point['count']) for point in series['daily']],
+            [(date(2026, 3, 15), 1), (date(2026, 3, 17), 2), (date(2026, 3, 18), 2)],
+        )
+        self.assertEqual(
+            [(point['week'], point['count']) for point in series['weekly']],
+            [(date(2026, 2, 2), 4), (date(2026, 3, 9), 1), (date(2026, 3, 16), 4)],
+        )
+        self.assertEqual(
+            [(point['month'], point['count'], point['revenue']) for point in series['monthly']],
+            [(date(2026, 2, 1), 4, Decimal('40.00')), (date(2026, 3, 1), 5, Decimal('50.00'))],
+        )
+
+    def test_order_list_reads_rollups(self):
+        self.create_order(self.user, '20.00', status='delivered')
+        self.create_order(self.user, '5.00')
+        self.create_order(self.other, '7.00')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('order-list'))
+        counts = {item['status']: item['count'] for item in response.context['status_chart_data']}
+        self.assertEqual(counts, {'delivered': 1, 'shipped': 0, 'pending': 1, 'returned': 0})
+        self.assertEqual(response.context['daily_orders'], [
+            {'day': self.today, 'count': 2, 'revenue': Decimal('25.00')},
+        ])
+
+        self.client.post(reverse('order-list'), {'order_id': Order.objects.get(total=5).pk, 'status': 'returned'})
+        response = self.client.get(reverse('order-list'))
+        counts = {item['status']: item['count'] for item in response.context['status_chart_data']}
+        self.assertEqual(counts['returned'], 1)
+        self.assertEqual(counts['pending'], 0)
+
+
+class OrderHistoryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = Brand.objects.create(name='History Brand')
+        self.product = Product.objects.create(
+            name='History Product', brand=brand, price=Decimal('10.00'), image='products/history.jpg'
+        )
+        self.variant = ProductVariant.objects.create(product=self.product, size='M', color='Red', stock=5)
+        self.user = User.objects.create_user(username='history', email='history@example.com', password='testpass')
+        self.client.force_login(self.user)
+
+    def create_orders(self, count, customer=None):
+        orders = []
+        for i in range(count):
+            order = Order.objects.create(
+                customer=customer or self.user, destination='Kampala', status='pending',
+                total=Decimal(i), item_count=2,
+            )
+            OrderItem.objects.create(order=order, product=self.product, unit_price=Decimal('10.00'), quantity=1)
+            OrderItem.objects.create(order=order, product_variant=self.variant, unit_price=Decimal('10.00'), quantity=1)
+            orders.append(order)
+        return orders
+
+    def walk(self, **params):
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('order-list'), {**params, **({'cursor': cursor} if cursor else {})})
+            page = response.context['page_obj']
+            seen.extend(page)
+            if not page.has_next():
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages(self):
+        orders = self.create_orders(45)
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.context['orders']), 20)
+        self.assertContains(response, 'Next')
+        self.assertContains(response, str(self.variant))
+        self.assertEqual(self.walk(), orders[::-1])
+        self.assertEqual(self.walk(sort='total_asc', min_total='5'), orders[5:])
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.create_orders(3)
+        self.client.get(reverse('order-list'))
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('order-list'))
+        self.create_orders(60)
+        with self.assertNumQueries(len(few)):
+            self.client.get(reverse('order-list'))
+
+    def test_invalid_cursor(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('order-list'), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_order_items(self):
+        order = self.create_orders(1)[0]
+        response = self.client.get(reverse('order-items', kwargs={'order_id': order.pk}))
+        data = response.json()
+        self.assertEqual(data['id'], order.pk)
+        self.assertEqual([item['name'] for item in data['items']], [str(self.product), str(self.variant)])
+        self.assertEqual(data['items'][0]['subtotal'], '10.00')
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass')
+        theirs = self.create_orders(1, customer=other)[0]
+        response = self.client.get(reverse('order-items', kwargs={'order_id': theirs.pk}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,70 @@
+"""
+Order totals stored on ``Order``.
+
+``total`` (the sum of the items' subtotals) and ``item_count`` (the sum of
+their quantities) let the order admin and ``order_list`` show, sort and
+filter orders by value from the order row alone. Checkout writes both when
+it creates the items; ``refresh_order_totals`` recomputes them from the
+items after they change (``OrderAdmin.save_related``, ``rebuild_order_totals``)
+and moves the revenue of the analytics rollups along with them.
+"""
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Order, OrderItem
+from .rollups import apply_order_change, order_state
+
+TOTAL_FIELDS = ['total', 'item_count']
+
+REFRESH_BATCH_SIZE = 500
+
+LINE_TOTAL = ExpressionWrapper(
+    (F('unit_price') - F('discount')) * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def order_totals(items):
+    """``(total, item_count)`` of unsaved or in-memory order ``items``."""
+    return (
+        sum((item.get_subtotal() for item in items), 0),
+        sum(item.quantity for item in items),
+    )
+
+
+def _aggregate(order_ids):
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('order_id')
+        .annotate(total=Sum(LINE_TOTAL), item_count=Sum('quantity'))
+        .order_by()
+    )
+    return {row.pop('order_id'): row for row in rows}
+
+
+def refresh_order_totals(order_ids=None):
+    """
+    Recompute the stored totals of ``order_ids`` (every order when ``None``)
+    in batches and return how many orders were written.
+    """
+    orders = Order.objects.order_by('pk').only('pk', 'customer_id', 'date', 'status', *TOTAL_FIELDS)
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+
+    written = 0
+    last_pk = 0
+    while True:
+        batch = list(orders.filter(pk__gt=last_pk)[:REFRESH_BATCH_SIZE])
+        if not batch:
+            return written
+        totals = _aggregate([order.pk for order in batch])
+        with transaction.atomic():
+            for order in batch:
+                previous = order_state(order)
+                row = totals.get(order.pk, {})
+                for field in TOTAL_FIELDS:
+                    setattr(order, field, row.get(field) or 0)
+                apply_order_change(previous, order_state(order))
+            Order.objects.bulk_update(batch, TOTAL_FIELDS)
+        written += len(batch)
+        last_pk = batch[-1].pk
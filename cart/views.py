@@ -1,88 +1,121 @@
+import json
+import uuid
+from decimal import Decimal
+
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import F
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Q
+from django.http import Http404, JsonResponse
+from django.utils.crypto import get_random_string
 from django.views.decorators.http import require_POST
 
-from .models import Cart, CartItem, OrderItem, Order
+from drobe.query_budget import query_budget
+
+from .counts import forget_item_count, refresh_item_count, set_item_count
+from .models import CART_SESSION_KEY, Cart, CartItem, IdempotencyKey, OrderItem, Order
+from .pricing import price_cart
+from .rollups import order_series, status_counts
+from .stock import OutOfStock, available_stock, commit_stock, reserve_stock
+from .totals import order_totals
 from products.models import Product, ProductVariant
+from products.pagination import InvalidCursor, KeysetPaginator
 
-from django.db.models import Count, Sum
-from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
-from datetime import timedelta
-from django.utils import timezone
+CENT = Decimal("0.01")
+
+# Upper bound on the lines one add_many_to_cart request may carry.
+MAX_BULK_LINES = 100
 
   
 # Helpers
-def _get_or_create_cart(request):
-    """Get or create a cart for the current user or session."""
+def _get_or_create_cart(request, create=True):
+    """
+    Get or create a cart for the current user or session.
+
+    Anonymous visitors get no session and no cart until they add something:
+    with ``create=False`` an unsaved, empty ``Cart`` stands in for theirs.
+    """
     if request.user.is_authenticated:
         cart, created = Cart.objects.get_or_create(customer=request.user)
 
         # Merge anonymous cart if it exists
-        if request.session.session_key:
-            anonymous_cart_qs = Cart.objects.filter(
-                session_key=request.session.session_key,
-                customer__isnull=True
-            )
-            if anonymous_cart_qs.exists():
-                anonymous_cart = anonymous_cart_qs.first()
-                for item in anonymous_cart.items.all():
-                    _merge_cart_item(cart, item)
-                anonymous_cart.delete()
-                request.session.pop('session_key', None)
+        cart_key = request.session.get(CART_SESSION_KEY)
+        if cart_key:
+            _merge_anonymous_cart(cart, cart_key)
+            request.session.pop(CART_SESSION_KEY, None)
         return cart
     else:
-        if not request.session.session_key:
-            request.session.create()
-        cart, created = Cart.objects.get_or_create(
-            session_key=request.session.session_key,
-            customer__isnull=True
-        )
+        cart_key = request.session.get(CART_SESSION_KEY)
+        if cart_key:
+            cart = Cart.objects.filter(session_key=cart_key, customer__isnull=True).first()
+            if cart:
+                return cart
+        if not create:
+            return Cart()
+        if not cart_key:
+            cart_key = request.session[CART_SESSION_KEY] = get_random_string(32)
+        cart, created = Cart.objects.get_or_create(session_key=cart_key, customer__isnull=True)
         return cart
 
 
-def _merge_cart_item(cart, item):
-    """Merge a single CartItem into another cart (variant or product)."""
-    lookup = {"cart": cart}
-    if item.product_variant:
-        lookup["product_variant"] = item.product_variant
-    else:
-        lookup["product"] = item.product
+def _merge_anonymous_cart(cart, cart_key):
+    """
+    Move the anonymous cart keyed ``cart_key`` into ``cart`` and delete it.
+
+    The cart is first claimed by re-keying it with a conditional ``UPDATE``;
+    only the request whose update matched the row goes on to merge it, so
+    when two logins race the second finds nothing to claim. Claiming first
+    also makes the transaction's first statement a write, so SQLite takes
+    its write lock up front instead of failing to upgrade a read lock.
+    """
+    claim = get_random_string(32)
+    with transaction.atomic():
+        claimed = (
+            Cart.objects.filter(session_key=cart_key, customer__isnull=True)
+            .update(session_key=claim)
+        )
+        if claimed != 1:
+            return
+        anonymous_cart = Cart.objects.get(session_key=claim)
+        cart.merge_items_from(anonymous_cart)
+        anonymous_cart.delete()
+    forget_item_count(Cart(session_key=cart_key))
+    refresh_item_count(cart)
 
-    cart_item, created = CartItem.objects.get_or_create(
-        **lookup,
-        defaults={"quantity": item.quantity}
-    )
-    if not created:
-        cart_item.quantity += item.quantity
-        cart_item.save()
 
+def _get_item_name(item):
+    """Return the display name for a cart or order item."""
+    return str(item.product_variant or item.product)
 
-def _get_item_price(item):
-    """Return price for a cart item, including discounts."""
-    if item.product_variant:
-        return item.product_variant.product.get_discounted_price()
-    return item.product.get_discounted_price()
 
+def _stock_message(variant, available):
+    if not available:
+        return f"{variant} is out of stock."
+    return f"Only {available} of {variant} left in stock."
 
-def _get_item_name(item):
-    """Return the display name for a cart item."""
-    return str(item.product_variant or item.product)
+
+def _out_of_stock_messages(request, items, error):
+    """Flash one error per cart line ``OutOfStock`` reports short."""
+    variants = {item.product_variant_id: item.product_variant for item in items if item.product_variant_id}
+    for variant_id, available in error.available.items():
+        messages.error(request, _stock_message(variants.get(variant_id, "An item"), available))
+    if not error.available:
+        messages.error(request, "Some items just went out of stock.")
 
 
   
 # Views
+@query_budget(9)
 def cart_detail(request):
     """Displays the contents of the cart."""
-    cart = _get_or_create_cart(request)
-    cart_items = cart.items.all()
-    total_price = sum(_get_item_price(item) * item.quantity for item in cart_items)
+    cart = _get_or_create_cart(request, create=False)
+    priced = price_cart(cart)
 
     context = {
         "cart": cart,
-        "cart_items": cart_items,
-        "total_price": total_price,
+        "cart_items": priced.items,
+        "total_price": priced.total,
     }
     return render(request, "cart/cart_detail.html", context)
 
@@ -103,7 +136,13 @@ def add_to_cart(request):
         # Determine whether it's a variant or product
         lookup = {"cart": cart}
         if product_variant_id:
-            lookup["product_variant"] = get_object_or_404(ProductVariant, id=product_variant_id)
+            variant = get_object_or_404(ProductVariant, id=product_variant_id)
+            in_cart = cart.items.filter(product_variant=variant).values_list("quantity", flat=True).first() or 0
+            available = available_stock([variant.pk], cart)[variant.pk]
+            if in_cart + quantity > available:
+                messages.error(request, _stock_message(variant, available))
+                return redirect("cart_detail")
+            lookup["product_variant"] = variant
         elif product_id:
             lookup["product"] = get_object_or_404(Product, id=product_id)
         else:
@@ -119,6 +158,8 @@ def add_to_cart(request):
             cart_item.quantity = F("quantity") + quantity
             cart_item.save()
             cart_item.refresh_from_db()
+        cart.touch()
+        refresh_item_count(cart)
 
         messages.success(request, f"{quantity} x {_get_item_name(cart_item)} added to your cart.")
         return redirect("cart_detail")
@@ -126,20 +167,148 @@ def add_to_cart(request):
     return redirect("cart_detail")
 
 
+def _parse_cart_lines(data):
+    """
+    Validate ``{"lines": [{"product_id" | "product_variant_id": id, "quantity": n}]}``
+    and return ``(product_quantities, variant_quantities)``, each mapping an
+    id to the total quantity requested for it. Raises ``ValueError``.
+    """
+    lines = data.get("lines") if isinstance(data, dict) else None
+    if not isinstance(lines, list) or not lines:
+        raise ValueError("Provide a non-empty list of lines.")
+    if len(lines) > MAX_BULK_LINES:
+        raise ValueError(f"At most {MAX_BULK_LINES} lines can be added at once.")
+
+    products, variants = {}, {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ValueError("Each line must be an object.")
+        product_id, variant_id = line.get("product_id"), line.get("product_variant_id")
+        quantity = line.get("quantity", 1)
+        if (product_id is None) == (variant_id is None):
+            raise ValueError("Each line needs either a product_id or a product_variant_id.")
+        target_id = product_id if product_id is not None else variant_id
+        if type(target_id) is not int or type(quantity) is not int:
+            raise ValueError("Ids and quantities must be integers.")
+        if quantity <= 0:
+            raise ValueError("Quantity must be at least 1.")
+        target = products if product_id is not None else variants
+        target[target_id] = target.get(target_id, 0) + quantity
+    return products, variants
+
+
+def _priced_cart_json(priced):
+    return {
+        "items": [
+            {
+                "id": item.pk,
+                "product_id": item.product_id,
+                "product_variant_id": item.product_variant_id,
+                "name": _get_item_name(item),
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "subtotal": item.subtotal,
+            }
+            for item in priced
+        ],
+        "item_count": priced.quantity,
+        "total": priced.total,
+    }
+
+
+@require_POST
+def add_many_to_cart(request):
+    """
+    Adds several products and variants to the cart at once ("buy the look",
+    reorders) and returns the priced cart as JSON.
+
+    Lines are validated with one ``IN`` lookup per model and applied with a
+    bulk update and a bulk create in one transaction.
+    """
+    try:
+        products, variants = _parse_cart_lines(json.loads(request.body))
+    except ValueError as e:  # JSONDecodeError is a ValueError
+        return JsonResponse({"error": str(e)}, status=400)
+
+    cart = _get_or_create_cart(request, create=False)
+    found_products = set(Product.objects.filter(pk__in=products).values_list("pk", flat=True))
+    available = available_stock(variants, cart)
+    found_variants = set(available)
+    missing = {
+        "product_id": sorted(set(products) - found_products),
+        "product_variant_id": sorted(set(variants) - found_variants),
+    }
+    if any(missing.values()):
+        return JsonResponse({"error": "Unknown products or variants.", "missing": missing}, status=400)
+
+    if cart.pk is None:
+        cart = _get_or_create_cart(request)
+    try:
+        _add_lines(cart, products, variants, available)
+    except OutOfStock as e:
+        return JsonResponse({"error": "Not enough stock.", "available": e.available}, status=409)
+
+    priced = price_cart(cart)
+    set_item_count(cart, priced.quantity)
+    return JsonResponse(_priced_cart_json(priced))
+
+
+def _add_lines(cart, products, variants, available):
+    """
+    Add ``{id: quantity}`` of products and variants to ``cart`` with one bulk
+    update and one bulk create. Raises ``OutOfStock`` (adding nothing) if a
+    variant's quantity in the cart would exceed ``available``.
+    """
+    with transaction.atomic():
+        # Write to the cart before reading its lines: the UPDATE takes the
+        # write lock (the whole database on SQLite, the cart row elsewhere),
+        # so a concurrent add to the cart waits here instead of reading the
+        # same quantities.
+        cart.touch()
+        existing = CartItem.objects.filter(cart=cart).filter(
+            Q(product_id__in=products, product_variant__isnull=True)
+            | Q(product_variant_id__in=variants, product__isnull=True)
+        )
+        products, variants = dict(products), dict(variants)
+        totals = dict(variants)
+        updated = []
+        for item in existing:
+            if item.product_variant_id:
+                item.quantity += variants.pop(item.product_variant_id)
+                totals[item.product_variant_id] = item.quantity
+            else:
+                item.quantity += products.pop(item.product_id)
+            updated.append(item)
+        short = {pk: available[pk] for pk, total in totals.items() if total > available[pk]}
+        if short:
+            raise OutOfStock(short)
+
+        CartItem.objects.bulk_update(updated, ["quantity"])
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pk, quantity=quantity) for pk, quantity in products.items()]
+            + [CartItem(cart=cart, product_variant_id=pk, quantity=quantity) for pk, quantity in variants.items()]
+        )
+
 
-def update_cart_item(request):
+def update_cart_item(request, item_id=None):
     """Updates the quantity of a specific cart item."""
     if request.method == "POST":
-        cart_item_id = request.POST.get("cart_item_id")
+        cart_item_id = request.POST.get("cart_item_id", item_id)
         new_quantity = int(request.POST.get("quantity", 1))
 
         cart_item = get_object_or_404(CartItem, id=cart_item_id)
-        cart = _get_or_create_cart(request)
+        cart = _get_or_create_cart(request, create=False)
 
         if cart_item.cart != cart:
             messages.error(request, "Invalid cart operation.")
             return redirect("cart_detail")
 
+        if new_quantity > cart_item.quantity and cart_item.product_variant_id:
+            available = available_stock([cart_item.product_variant_id], cart)[cart_item.product_variant_id]
+            if new_quantity > available:
+                messages.error(request, _stock_message(cart_item.product_variant, available))
+                return redirect("cart_detail")
+
         if new_quantity > 0:
             cart_item.quantity = new_quantity
             cart_item.save()
@@ -147,18 +316,20 @@ def update_cart_item(request):
         else:
             messages.warning(request, f"{_get_item_name(cart_item)} removed from your cart.")
             cart_item.delete()
+        cart.touch()
+        refresh_item_count(cart)
 
         return redirect("cart_detail")
 
     return redirect("cart_detail")
 
 
-def remove_from_cart(request):
+def remove_from_cart(request, item_id=None):
     """Removes a specific item from the cart."""
     if request.method == "POST":
-        cart_item_id = request.POST.get("cart_item_id")
+        cart_item_id = request.POST.get("cart_item_id", item_id)
         cart_item = get_object_or_404(CartItem, id=cart_item_id)
-        cart = _get_or_create_cart(request)
+        cart = _get_or_create_cart(request, create=False)
 
         if cart_item.cart != cart:
             messages.error(request, "Invalid cart operation.")
@@ -166,6 +337,8 @@ def remove_from_cart(request):
 
         messages.warning(request, f"{_get_item_name(cart_item)} removed from your cart.")
         cart_item.delete()
+        cart.touch()
+        refresh_item_count(cart)
         return redirect("cart_detail")
 
     return redirect("cart_detail")
@@ -174,29 +347,40 @@ def remove_from_cart(request):
 def clear_cart(request):
     """Clears all items from the cart."""
     if request.method == "POST":
-        cart = _get_or_create_cart(request)
-        cart.items.all().delete()
+        cart = _get_or_create_cart(request, create=False)
+        if cart.pk:
+            cart.clear()
+            cart.touch()
+            set_item_count(cart, 0)
         messages.info(request, "Your cart has been cleared.")
         return redirect("cart_detail")
     return redirect("cart_detail")
 
 
+@query_budget(15)
 @login_required
 def checkout(request):
     """Displays the checkout page."""
     cart = _get_or_create_cart(request)
-    cart_items = cart.items.all()
+    priced = price_cart(cart)
 
-    if not cart_items.exists():
+    if not priced:
         messages.warning(request, "Your cart is empty.")
         return redirect("cart_detail")
 
-    total_price = sum(_get_item_price(item) * item.quantity for item in cart_items)
+    # Hold the variants' stock while the customer fills in the form.
+    try:
+        reserve_stock(cart, priced)
+    except OutOfStock as e:
+        _out_of_stock_messages(request, priced, e)
+        return redirect("cart_detail")
 
     context = {
         "cart": cart,
-        "cart_items": cart_items,
-        "total_price": total_price,
+        "cart_items": priced.items,
+        "total_price": priced.total,
+        # Lets process_order recognise a retried submission of this form.
+        "idempotency_key": uuid.uuid4().hex,
     }
     return render(request, "cart/checkout.html", context)
 
@@ -205,11 +389,13 @@ def checkout(request):
 @login_required
 def process_order(request):
     """Handles final order processing."""
-    cart = _get_or_create_cart(request)
+    # A retry of a submission that already placed its order gets the same
+    # response again, without touching the cart.
+    idempotency_key = request.POST.get("idempotency_key", "")[:64]
+    if idempotency_key and _completed_order(request.user, idempotency_key):
+        return _order_placed(request)
 
-    if not cart.items.exists():
-        messages.error(request, "Your cart is empty.")
-        return redirect("cart_detail")
+    cart = _get_or_create_cart(request)
 
     # ✅ Get telephone & destination from form
     telephone = request.POST.get("telephone", "").strip()
@@ -219,36 +405,119 @@ def process_order(request):
         messages.error(request, "Please provide both telephone and destination.")
         return redirect("checkout")  # or wherever your checkout form is
 
-    # 1. Create Order
-    order = Order.objects.create(
-        customer=request.user,
-        telephone=telephone,
-        destination=destination,
-        paid=False,      # set after integrating payments
-        status="pending" # default order status
-    )
-
-    # 2. Create OrderItems
-    for item in cart.items.all():
-        unit_price = item.get_unit_price()
-        discount = 0  # TODO: add discount logic later
-
-        OrderItem.objects.create(
-            order=order,
-            product=item.product if item.product else None,
-            product_variant=item.product_variant if item.product_variant else None,
-            unit_price=unit_price,
-            discount=discount,
-            quantity=item.quantity,
+    try:
+        order = _place_order(
+            cart, request.user, idempotency_key=idempotency_key, telephone=telephone, destination=destination
         )
+    except OutOfStock as e:
+        _out_of_stock_messages(request, price_cart(cart), e)
+        return redirect("cart_detail")
+    except IntegrityError:
+        # A concurrent request with the same key got there first.
+        if idempotency_key and _completed_order(request.user, idempotency_key):
+            return _order_placed(request)
+        raise
+    if order is None:
+        # Emptied by a concurrent request with the same key, or just empty.
+        if idempotency_key and _completed_order(request.user, idempotency_key):
+            return _order_placed(request)
+        messages.error(request, "Your cart is empty.")
+        return redirect("cart_detail")
+    set_item_count(cart, 0)
+    return _order_placed(request)
 
-    # 3. Clear cart
-    cart.clear()
 
+def _order_placed(request):
     messages.success(request, "Your order has been placed successfully!")
     return redirect("dashboard")
 
 
+def _completed_order(customer, idempotency_key):
+    """Id of the order already placed with ``idempotency_key``, if any."""
+    return (
+        IdempotencyKey.objects.filter(customer=customer, key=idempotency_key)
+        .values_list("order_id", flat=True)
+        .first()
+    )
+
+
+def _place_order(cart, customer, idempotency_key="", **details):
+    """
+    Turn ``cart`` into an order in one transaction: price every line in a
+    batch, create the order and all of its items, and empty the cart.
+    Returns ``None`` if the cart is empty (or was checked out concurrently),
+    and raises ``OutOfStock`` if a variant can no longer be covered.
+
+    Each line locks in the product's list price as ``unit_price`` and the
+    per-unit discount in effect now as ``discount``; the order stores their
+    total and item count. An ``idempotency_key`` is stored with the order in
+    the same transaction; a concurrent request with the same key finds the
+    cart emptied, or fails with ``IntegrityError``.
+    """
+    with transaction.atomic():
+        # Write to the cart before reading it: the UPDATE takes the write
+        # lock (the whole database on SQLite, the cart row elsewhere), so a
+        # concurrent checkout waits here and then sees the cart emptied.
+        cart.touch()
+        priced = price_cart(cart)
+        if not priced:
+            return None
+        commit_stock(cart, priced)
+
+        items = [
+            OrderItem(
+                product_id=item.product_id,
+                product_variant_id=item.product_variant_id,
+                unit_price=item.list_price,
+                discount=(item.list_price - item.unit_price).quantize(CENT),
+                quantity=item.quantity,
+            )
+            for item in priced
+        ]
+        total, item_count = order_totals(items)
+        order = Order.objects.create(
+            customer=customer,
+            paid=False,      # set after integrating payments
+            status="pending", # default order status
+            total=total,
+            item_count=item_count,
+            **details,
+        )
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        cart.clear()
+        if idempotency_key:
+            IdempotencyKey.objects.create(customer=customer, key=idempotency_key, order=order)
+    return order
+
+
+# order_list ?sort= values: the keyset each pages on, and whether descending.
+ORDER_SORTS = {
+    "newest": (("date", "id"), True),
+    "oldest": (("date", "id"), False),
+    "total_desc": (("total", "id"), True),
+    "total_asc": (("total", "id"), False),
+}
+
+ORDERS_PER_PAGE = 20
+
+
+def _order_lines():
+    """Order items with the products and variants their names need."""
+    return OrderItem.objects.select_related("product", "product_variant__product").order_by("pk")
+
+
+def _total_bound(value):
+    """Parse a ``min_total``/``max_total`` query value; ``None`` if unusable."""
+    try:
+        bound = Decimal(value)
+    except (TypeError, ArithmeticError):
+        return None
+    return bound if bound.is_finite() else None
+
+
+@query_budget(7)
 @login_required
 def order_list(request):
     orders = Order.objects.filter(customer=request.user).order_by("-date")
@@ -267,9 +536,8 @@ def order_list(request):
 
         return redirect("order-list")
 
-    # Status counts for horizontal bar chart
-    status_counts = orders.values('status').annotate(count=Count('id')).order_by('-count')
-    status_data = {item['status']: item['count'] for item in status_counts}
+    # Status counts for horizontal bar chart, from the daily rollups
+    status_data = status_counts(request.user)
 
     # Prepare status counts in order (delivered, shipped, pending, returned)
     status_order = ['delivered', 'shipped', 'pending', 'returned']
@@ -281,42 +549,73 @@ def order_list(request):
             'count': status_data.get(status, 0)
         })
 
-    # Orders over time (last 30 days) for line chart
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    daily_orders = (
-        orders.filter(date__gte=thirty_days_ago)
-        .annotate(day=TruncDate('date'))
-        .values('day')
-        .annotate(count=Count('id'))
-        .order_by('day')
-    )
-
-    # Orders by week (last 12 weeks)
-    twelve_weeks_ago = timezone.now() - timedelta(weeks=12)
-    weekly_orders = (
-        orders.filter(date__gte=twelve_weeks_ago)
-        .annotate(week=TruncWeek('date'))
-        .values('week')
-        .annotate(count=Count('id'))
-        .order_by('week')
-    )
-
-    # Orders by month (last 12 months)
-    twelve_months_ago = timezone.now() - timedelta(days=365)
-    monthly_orders = (
-        orders.filter(date__gte=twelve_months_ago)
-        .annotate(month=TruncMonth('date'))
-        .values('month')
-        .annotate(count=Count('id'))
-        .order_by('month')
-    )
+    # Orders per day (last 30 days), week (last 12 weeks) and month (last
+    # 12 months) for the line and bar charts
+    series = order_series(request.user)
+
+    # Orders table: sorted and filtered by the stored totals
+    sort = request.GET.get("sort")
+    if sort not in ORDER_SORTS:
+        sort = "newest"
+    min_total = _total_bound(request.GET.get("min_total"))
+    max_total = _total_bound(request.GET.get("max_total"))
+    table_orders = orders.prefetch_related(Prefetch("items", queryset=_order_lines()))
+    if min_total is not None:
+        table_orders = table_orders.filter(total__gte=min_total)
+    if max_total is not None:
+        table_orders = table_orders.filter(total__lte=max_total)
+
+    # One keyset page at a time, with its items in a single extra query, so
+    # the page costs the same however many orders the customer has placed.
+    fields, descending = ORDER_SORTS[sort]
+    try:
+        page = KeysetPaginator(table_orders, ORDERS_PER_PAGE, fields, descending).page(request.GET.get("cursor"))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    params = request.GET.copy()
+    params.pop("cursor", None)
 
     context = {
-        'orders': orders,
+        'has_orders': bool(status_data),
+        'orders': page,
+        'page_obj': page,
+        'querystring': params.urlencode(),
+        'sort': sort,
+        'min_total': min_total,
+        'max_total': max_total,
         'status_chart_data': status_chart_data,
-        'daily_orders': list(daily_orders),
-        'weekly_orders': list(weekly_orders),
-        'monthly_orders': list(monthly_orders),
+        'daily_orders': series['daily'],
+        'weekly_orders': series['weekly'],
+        'monthly_orders': series['monthly'],
     }
 
-    return render(request, "orders/order_list.html", context)
\ No newline at end of file
+    return render(request, "orders/order_list.html", context)
+
+
+@query_budget(4)
+@login_required
+def order_items(request, order_id):
+    """Return one of the customer's orders with its lines as JSON."""
+    order = get_object_or_404(
+        Order.objects.prefetch_related(Prefetch("items", queryset=_order_lines())),
+        pk=order_id, customer=request.user,
+    )
+    return JsonResponse({
+        "id": order.pk,
+        "status": order.status,
+        "items": [
+            {
+                "id": item.pk,
+                "product_id": item.product_id,
+                "product_variant_id": item.product_variant_id,
+                "name": _get_item_name(item),
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "discount": item.discount,
+                "subtotal": item.get_subtotal(),
+            }
+            for item in order.items.all()
+        ],
+        "item_count": order.item_count,
+        "total": order.total,
+    })
\ No newline at end of file
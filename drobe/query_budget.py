@@ -0,0 +1,108 @@
+"""
+Per-view SQL query budgets.
+
+Declare how many queries a view may run::
+
+    @query_budget(8)
+    def cart_detail(request): ...
+
+    @query_budget(10)
+    class ProductDetailView(DetailView): ...
+
+With ``DEBUG`` on, ``QueryBudgetMiddleware`` counts and times every query a
+request runs (context processors and template rendering included) and logs
+a warning when a view goes over its budget, or raises ``QueryBudgetExceeded``
+when ``QUERY_BUDGET_RAISE`` is set. ``QueryBudgetTestMixin`` asserts the
+same budgets in tests, where ``DEBUG`` is off.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most queries a function or class-based view may run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view_func):
+    """The budget declared on a resolved view function, or ``None``."""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view_func, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that counts and times queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        budget = getattr(request, 'query_budget', None)
+        message = (
+            f"{request.method} {request.path} ran {counter.count} queries "
+            f"in {counter.duration * 1000:.1f}ms"
+        )
+        if budget is not None and counter.count > budget:
+            message += f", over its budget of {budget}"
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        else:
+            logger.debug(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
+
+
+class QueryBudgetTestMixin:
+    """``TestCase`` mixin asserting a URL stays within its view's budget."""
+
+    def assertWithinQueryBudget(self, url, data=None, method='get'):
+        budget = get_query_budget(resolve(url.split('?')[0]).func)
+        self.assertIsNotNone(budget, f"{url} declares no query budget")
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{url} ran {len(queries)} queries, over its budget of {budget}:\n"
+            + "\n".join(query['sql'] for query in queries.captured_queries),
+        )
+        return response
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'drobe.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +85,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Tests run against a file too: threads sharing an in-memory
+        # database fail on its table locks instead of waiting for them.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -139,3 +143,58 @@ LOGOUT_REDIRECT_URL = 'dashboard'  # after logout
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (Redis, Memcached) when running more than one process,
+# so home page invalidation reaches every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'drobe-default',
+    }
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+# Sessions stay in the database by default so logging out or changing a
+# password revokes them server-side. Anonymous visitors only get a session once
+# they add to the cart, and their cart is found through a key stored in it
+# (CART_SESSION_KEY), which works with any engine. Set DROBE_SESSION_ENGINE to
+# 'django.contrib.sessions.backends.cache' or
+# 'django.contrib.sessions.backends.signed_cookies' to keep sessions out of the
+# database; signed cookie sessions cannot be revoked before they expire.
+SESSION_ENGINE = os.environ.get('DROBE_SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
+# purge_abandoned_carts deletes anonymous carts untouched for longer than the
+# session cookie's lifetime (SESSION_COOKIE_AGE, two weeks by default) unless
+# a live database session still holds their key; set ANONYMOUS_CART_MAX_AGE
+# (seconds) to use a different age.
+
+
+# Safety net for cached home page sections; saves invalidate them right away
+# and the rollover_prices command refreshes them at date boundaries.
+HOMEPAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Storefront facet counts, keyed by search and price range; product and
+# discount changes drop them right away.
+FACET_CACHE_TIMEOUT = 60 * 5
+
+# Navbar cart counts; the cart views refresh them on every change, so this
+# only bounds how long an edit made elsewhere (the admin) can go unseen.
+CART_COUNT_CACHE_TIMEOUT = 60 * 60
+
+# How long starting checkout holds variant stock for a cart (seconds); the
+# reap_stock_holds command deletes holds once they expire.
+STOCK_HOLD_TTL = 60 * 10
+
+# Checkout idempotency keys let retried order submissions replay the first
+# result; purge_idempotency_keys drops them after this many hours.
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Per-view query budgets (drobe.query_budget): in DEBUG, requests over their
+# view's budget are logged, or raise when this is True.
+QUERY_BUDGET_RAISE = False
@@ -0,0 +1,151 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+
+from cart.models import Cart, CartItem, Order, OrderItem
+from products.models import Brand, Category, Discount, Product, ProductReview, ProductVariant
+
+from .query_budget import QueryBudgetExceeded, QueryBudgetTestMixin, get_query_budget, query_budget
+
+User = get_user_model()
+
+
+class QueryBudgetTest(QueryBudgetTestMixin, TestCase):
+    """Test every customer-facing and dashboard view stays within its query budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='shopper', email='shopper@example.com', password='testpass123'
+        )
+        reviewers = [
+            User.objects.create(username=f'reviewer{i}', email=f'reviewer{i}@example.com')
+            for i in range(12)
+        ]
+        brands = [Brand.objects.create(name=f'Brand {i}') for i in range(4)]
+        categories = [value for value, label in Category.choices]
+        cls.products = [
+            Product.objects.create(
+                name=f'Product {i}', brand=brands[i % 4], category=categories[i % len(categories)],
+                price=Decimal('10.00') + i, image=f'products/product_{i}.jpg',
+            )
+            for i in range(40)
+        ]
+        cls.products[0].tags.add('summer', 'cotton')
+        variants = [
+            ProductVariant.objects.create(product=product, size='M', color='RED', stock=5)
+            for product in cls.products[:10]
+        ]
+
+        discount = Discount.objects.create(
+            name='Sale', discount_type=Discount.PERCENTAGE, value=Decimal('10'),
+            start_date=date.today() - timedelta(days=1), categories=[Category.SHOES],
+        )
+        discount.brands.add(brands[0])
+        discount.products.add(cls.products[1])
+
+        for reviewer in reviewers:
+            ProductReview.objects.create(
+                product=cls.products[0], user=reviewer, variant=variants[0], rating=4, comment='Nice'
+            )
+
+        cart = Cart.objects.create(customer=cls.user)
+        for product in cls.products[10:16]:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        for variant in variants[:4]:
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=1)
+
+        for i in range(10):
+            order = Order.objects.create(customer=cls.user, destination='Kampala', status='pending')
+            for product in cls.products[i:i + 3]:
+                OrderItem.objects.create(order=order, product=product, unit_price=product.price, quantity=1)
+            OrderItem.objects.create(order=order, product_variant=variants[i], unit_price=Decimal('10.00'), quantity=1)
+        cls.order = order
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        self.assertWithinQueryBudget(reverse('dashboard'))
+
+    def test_product_listing(self):
+        self.assertWithinQueryBudget(reverse('all_products_list'))
+        self.assertWithinQueryBudget(reverse('all_products_list'), {'q': 'product', 'brand': self.products[0].brand_id})
+
+    def test_product_detail(self):
+        self.assertWithinQueryBudget(reverse('product_detail', kwargs={'pk': self.products[0].pk}))
+
+    def test_cart(self):
+        self.assertWithinQueryBudget(reverse('cart_detail'))
+
+    def test_checkout(self):
+        self.assertWithinQueryBudget(reverse('checkout'))
+
+    def test_order_list(self):
+        self.assertWithinQueryBudget(reverse('order-list'))
+        self.assertWithinQueryBudget(reverse('order-items', kwargs={'order_id': self.order.pk}))
+
+    def test_dashboard(self):
+        self.assertWithinQueryBudget(reverse('product-list'))
+        self.assertWithinQueryBudget(reverse('brand-list'))
+        self.assertWithinQueryBudget(reverse('discount-list'))
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    """Test the debug-mode budget middleware"""
+
+    def test_declared_budget(self):
+        """Test budgets are found on function and class-based views"""
+        @query_budget(3)
+        def view(request):
+            pass
+
+        class View:
+            query_budget = 4
+
+        def as_view(request):
+            pass
+        as_view.view_class = View
+
+        self.assertEqual(get_query_budget(view), 3)
+        self.assertEqual(get_query_budget(as_view), 4)
+        self.assertIsNone(get_query_budget(lambda request: None))
+
+    @override_settings(DEBUG=True, QUERY_BUDGET_RAISE=True)
+    def test_raises_over_budget(self):
+        """Test a view over budget raises in debug"""
+        with self.settings(ROOT_URLCONF='drobe.tests'):
+            self.assertEqual(self.client.get('/within/').status_code, 200)
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/over/')
+
+    @override_settings(DEBUG=True)
+    def test_logs_over_budget(self):
+        """Test a view over budget logs a warning when not raising"""
+        with self.settings(ROOT_URLCONF='drobe.tests'):
+            with self.assertLogs('drobe.query_budget', 'WARNING') as logs:
+                self.client.get('/over/')
+        self.assertIn('GET /over/ ran 2 queries', logs.output[0])
+        self.assertIn('over its budget of 1', logs.output[0])
+
+
+# URLs for QueryBudgetMiddlewareTest
+def _brand_list_view(times):
+    @query_budget(1)
+    def view(request):
+        for _ in range(times):
+            list(Brand.objects.all())
+        return HttpResponse()
+    return view
+
+
+urlpatterns = [
+    path('within/', _brand_list_view(1)),
+    path('over/', _brand_list_view(2)),
+]
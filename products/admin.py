@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib import admin
+from .forms import DiscountCategoriesMixin
 from .models import Brand, Product, ProductVariant, Discount, ProductReview, Category
 
 
@@ -27,7 +28,7 @@ class ProductReviewInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'brand', 'category', 'price', 'created_at')
+    list_display = ('name', 'brand', 'category', 'price', 'review_count', 'created_at')
     list_filter = ('brand', 'category', 'created_at')
     search_fields = ('name', 'brand__name')
     inlines = [ProductVariantInline, ProductReviewInline]
@@ -42,7 +43,7 @@ class ProductVariantAdmin(admin.ModelAdmin):
 
 
 
-class DiscountForm(forms.ModelForm):
+class DiscountForm(DiscountCategoriesMixin, forms.ModelForm):
     categories = forms.MultipleChoiceField(
         choices=Category.choices,
         widget=forms.CheckboxSelectMultiple,
@@ -67,3 +68,14 @@ class ProductReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'variant', 'rating', 'approved', 'created_at')
     list_filter = ('approved', 'rating', 'created_at')
     search_fields = ('product__name', 'user__username', 'variant__size', 'variant__color')
+    actions = ['approve_reviews', 'unapprove_reviews']
+
+    @admin.action(description='Approve selected reviews')
+    def approve_reviews(self, request, queryset):
+        updated = queryset.set_approved(True)
+        self.message_user(request, f"{updated} review(s) approved.")
+
+    @admin.action(description='Unapprove selected reviews')
+    def unapprove_reviews(self, request, queryset):
+        updated = queryset.set_approved(False)
+        self.message_user(request, f"{updated} review(s) unapproved.")
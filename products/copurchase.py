@@ -0,0 +1,174 @@
+"""
+"Frequently bought together" neighbours built from order history.
+
+``count_pairs`` turns (order, product) rows into a sparse co-occurrence
+matrix with numpy: for every pair of distinct products it counts the orders
+containing both. ``update_copurchases`` folds the order items added since
+the previous run into the stored counts and keeps the ``top_k`` strongest
+neighbours of each product in ``CoPurchase``, which the product detail page
+reads with a single indexed query.
+
+Runs track the last ``OrderItem`` they saw, so items added to an existing
+order (through the admin, say) are counted too: the pairs of every order
+touched since the last run are counted with and without its new items, and
+the difference is folded in. Removed items are not noticed, and pairs that
+fall out of a product's top K are dropped, so their earlier counts are lost
+to later incremental runs; a periodic ``full`` run rebuilds the table
+exactly.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+
+from cart.models import OrderItem
+
+from .models import CoPurchase, CoPurchaseRun
+
+TOP_K = getattr(settings, 'COPURCHASE_TOP_K', 20)
+
+# Orders with more distinct products than this (bulk buys, test orders)
+# say little about what goes together and cost n² pairs; they are skipped.
+MAX_ORDER_PRODUCTS = 50
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def count_pairs(order_ids, product_ids, max_order_products=MAX_ORDER_PRODUCTS):
+    """
+    Count co-occurrences from parallel ``order_ids`` / ``product_ids``.
+
+    Returns arrays ``(products, related, counts)`` with one entry per ordered
+    pair of distinct products bought together, in both directions.
+    """
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    if not len(order_ids):
+        return _EMPTY, _EMPTY, _EMPTY
+
+    # One row per distinct (order, product), grouped by order.
+    width = int(product_ids.max()) + 1
+    keys = np.unique(order_ids * width + product_ids)
+    orders, products = keys // width, keys % width
+    _, sizes = np.unique(orders, return_counts=True)
+    keep = np.repeat(sizes <= max_order_products, sizes)
+    orders, products = orders[keep], products[keep]
+    _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+
+    # Pair each row with every later row of its order: row i has
+    # `later[i]` partners, at positions i+1 .. i+later[i].
+    ends = np.repeat(starts + sizes, sizes)
+    later = ends - np.arange(len(products)) - 1
+    first = np.repeat(np.arange(len(products)), later)
+    block_starts = np.repeat(np.cumsum(later) - later, later)
+    second = first + 1 + (np.arange(len(first)) - block_starts)
+
+    a, b = products[first], products[second]
+    return _sum_pairs(np.concatenate([a, b]), np.concatenate([b, a]), np.ones(2 * len(a), dtype=np.int64))
+
+
+def _sum_pairs(products, related, counts):
+    """Add up ``counts`` of duplicate (product, related) pairs."""
+    if not len(products):
+        return _EMPTY, _EMPTY, _EMPTY
+    width = int(max(products.max(), related.max())) + 1
+    keys, inverse = np.unique(products * width + related, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts).astype(np.int64)
+    return keys // width, keys % width, totals
+
+
+def top_neighbours(products, related, counts, top_k=TOP_K):
+    """Keep the ``top_k`` highest counts per product (ties by related id)."""
+    if not len(products):
+        return _EMPTY, _EMPTY, _EMPTY
+    order = np.lexsort((related, -counts, products))
+    products, related, counts = products[order], related[order], counts[order]
+    _, starts, sizes = np.unique(products, return_index=True, return_counts=True)
+    rank = np.arange(len(products)) - np.repeat(starts, sizes)
+    keep = rank < top_k
+    return products[keep], related[keep], counts[keep]
+
+
+def _batches(ids, size=500):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _order_lines(**lookup):
+    lines = (
+        OrderItem.objects.filter(**lookup)
+        .annotate(target_id=Coalesce('product_id', 'product_variant__product_id'))
+        .filter(target_id__isnull=False)
+        .values_list('order_id', 'target_id')
+    )
+    array = np.array(list(lines.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    return array[:, 0], array[:, 1]
+
+
+def _new_pairs(after, upto):
+    """
+    Pair counts gained by the items ``after < pk <= upto``: the pairs of the
+    orders they belong to, minus the pairs those orders already had.
+    """
+    touched = OrderItem.objects.filter(pk__gt=after, pk__lte=upto).values('order_id')
+    order_ids, product_ids = _order_lines(order_id__in=touched, pk__lte=upto)
+    now = count_pairs(order_ids, product_ids)
+    before = count_pairs(*_order_lines(order_id__in=touched, pk__lte=after))
+    products, related, counts = _sum_pairs(
+        np.concatenate([now[0], before[0]]),
+        np.concatenate([now[1], before[1]]),
+        np.concatenate([now[2], -before[2]]),
+    )
+    changed = counts != 0
+    return order_ids, (products[changed], related[changed], counts[changed])
+
+
+def update_copurchases(full=False, top_k=TOP_K):
+    """
+    Fold order items added since the last run (every item when ``full``)
+    into ``CoPurchase`` and record the run. Returns the ``CoPurchaseRun``.
+    """
+    last_run = None if full else CoPurchaseRun.objects.order_by('-last_item_id').first()
+    after = last_run.last_item_id if last_run else 0
+    upto = OrderItem.objects.aggregate(upto=Max('pk'))['upto'] or after
+
+    if last_run is None:
+        order_ids, product_ids = _order_lines(pk__lte=upto)
+        products, related, counts = count_pairs(order_ids, product_ids)
+    else:
+        order_ids, (products, related, counts) = _new_pairs(after, upto)
+
+    full = full or last_run is None
+    with transaction.atomic():
+        if full:
+            CoPurchase.objects.all().delete()
+        else:
+            # Merge the new counts into the stored rows of every product
+            # they touch, then re-rank those products.
+            stored = []
+            for batch in _batches(np.unique(products).tolist()):
+                rows = CoPurchase.objects.filter(product_id__in=batch)
+                stored += rows.values_list('product_id', 'related_id', 'count')
+                rows.delete()
+            stored = np.array(stored, dtype=np.int64).reshape(-1, 3)
+            products, related, counts = _sum_pairs(
+                np.concatenate([products, stored[:, 0]]),
+                np.concatenate([related, stored[:, 1]]),
+                np.concatenate([counts, stored[:, 2]]),
+            )
+            # An order that grew past MAX_ORDER_PRODUCTS takes its pairs back.
+            kept = counts > 0
+            products, related, counts = products[kept], related[kept], counts[kept]
+
+        products, related, counts = top_neighbours(products, related, counts, top_k)
+        CoPurchase.objects.bulk_create(
+            [
+                CoPurchase(product_id=p, related_id=r, count=c)
+                for p, r, c in zip(products.tolist(), related.tolist(), counts.tolist())
+            ],
+            batch_size=1000,
+        )
+        return CoPurchaseRun.objects.create(
+            last_item_id=upto, orders=len(np.unique(order_ids)), full=full
+        )
@@ -0,0 +1,135 @@
+"""
+Facet counts for the storefront product list.
+
+One ``GROUP BY category, brand, price bucket`` query over the searched and
+price-filtered products yields every count the sidebar needs. The category
+and brand selections are applied to those rows in Python, so each facet
+counts against the other selections but not its own (picking a brand still
+shows how many products the other brands have). The grouped rows are cached
+by the normalized search and price filters.
+"""
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .models import Category
+
+# (low, high) bounds on current_price; low inclusive, high exclusive.
+PRICE_BUCKETS = (
+    (None, Decimal('25')),
+    (Decimal('25'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('200')),
+    (Decimal('200'), None),
+)
+
+CACHE_TIMEOUT = getattr(settings, 'FACET_CACHE_TIMEOUT', 60 * 5)
+
+_GENERATION_KEY = 'facets:generation'
+
+
+def price_bucket_filter(index):
+    """
+    ``Q`` for products priced in ``PRICE_BUCKETS[index]``. Bucket links
+    filter with it, so a bucket lists exactly the products it counts.
+    """
+    low, high = PRICE_BUCKETS[index]
+    condition = Q()
+    if low is not None:
+        condition &= Q(current_price__gte=low)
+    if high is not None:
+        condition &= Q(current_price__lt=high)
+    return condition
+
+
+def parse_price_bucket(value):
+    """The bucket index in a ``price_bucket`` query value, or ``None``."""
+    if value and value.isdigit() and int(value) < len(PRICE_BUCKETS):
+        return int(value)
+    return None
+
+
+def _price_bucket():
+    whens = [When(price_bucket_filter(i), then=Value(i)) for i in range(len(PRICE_BUCKETS))]
+    return Case(*whens, output_field=IntegerField())
+
+
+def _normalize_price(value):
+    try:
+        return str(Decimal(value).normalize())
+    except (InvalidOperation, TypeError):
+        return value or ''
+
+
+def cache_key(query='', min_price='', max_price='', price_bucket=None):
+    """Cache key of the grouped counts for a search, price range and bucket."""
+    filters = [
+        ' '.join((query or '').lower().split()),
+        _normalize_price(min_price),
+        _normalize_price(max_price),
+        price_bucket,
+    ]
+    digest = hashlib.md5(json.dumps(filters).encode()).hexdigest()
+    generation = cache.get_or_set(_GENERATION_KEY, lambda: uuid4().hex, None)
+    return f'facets:{generation}:{digest}'
+
+
+def grouped_counts(queryset):
+    """
+    ``[(category, brand_id, price_bucket, count)]`` for ``queryset``, which
+    must be annotated with ``current_price``.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=_price_bucket())
+        .values_list('category', 'brand_id', 'price_bucket')
+        .annotate(count=Count('id', distinct=True))
+    )
+    return [tuple(row) for row in rows]
+
+
+def facet_counts(queryset, query='', min_price='', max_price='', price_bucket=None, category=None, brand_id=None):
+    """
+    Count ``queryset`` (already searched and price filtered) per category,
+    brand and price bucket under the selected ``category`` and ``brand_id``.
+
+    Returns ``{'categories': {value: n}, 'brands': {id: n}, 'price_buckets':
+    [n, ...]}``; values with no matches are left out of the dicts.
+    """
+    key = cache_key(query, min_price, max_price, price_bucket)
+    rows = cache.get(key)
+    if rows is None:
+        rows = grouped_counts(queryset)
+        cache.set(key, rows, CACHE_TIMEOUT)
+
+    categories, brands = {}, {}
+    price_buckets = [0] * len(PRICE_BUCKETS)
+    for row_category, row_brand, bucket, count in rows:
+        category_match = category is None or row_category == category
+        brand_match = brand_id is None or row_brand == brand_id
+        if brand_match:
+            categories[row_category] = categories.get(row_category, 0) + count
+        if category_match:
+            brands[row_brand] = brands.get(row_brand, 0) + count
+        if category_match and brand_match and bucket is not None:
+            price_buckets[bucket] += count
+    return {'categories': categories, 'brands': brands, 'price_buckets': price_buckets}
+
+
+def category_options(counts, selected=None):
+    """``(value, label, count)`` for categories with matches, plus ``selected``."""
+    return [
+        (value, label, counts.get(value, 0))
+        for value, label in Category.choices
+        if counts.get(value) or value == selected
+    ]
+
+
+def invalidate():
+    """Forget every cached facet count."""
+    cache.set(_GENERATION_KEY, uuid4().hex, None)
@@ -34,7 +34,20 @@ class ProductVariantForm(forms.ModelForm):
 
 
 # DISCOUNT FORM
-class DiscountForm(forms.ModelForm):
+class DiscountCategoriesMixin:
+    """Read and write the declared ``categories`` field through ``Discount.categories``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and 'categories' not in self.initial:
+            self.initial['categories'] = self.instance.categories
+
+    def save(self, commit=True):
+        self.instance.categories = self.cleaned_data.get('categories', [])
+        return super().save(commit=commit)
+
+
+class DiscountForm(DiscountCategoriesMixin, forms.ModelForm):
     categories = forms.MultipleChoiceField(
         choices=Category.choices,
         required=False,
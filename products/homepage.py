@@ -0,0 +1,106 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.functional import SimpleLazyObject
+
+from .models import Brand, Category, Discount, Product
+from .pricing import attach_prices
+
+SECTIONS = ('carousel', 'men_women', 'discounted', 'other')
+
+# Sections whose content can change when a row of the given model changes.
+SECTION_DEPENDENCIES = {
+    Product: SECTIONS,
+    Brand: ('discounted', 'other'),
+    Discount: ('discounted', 'other'),
+}
+
+CACHE_TIMEOUT = getattr(settings, 'HOMEPAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _ids_key(section):
+    return f'homepage:{section}:ids'
+
+
+def fragment_key(section):
+    """Cache key of the ``{% cache CACHE_TIMEOUT homepage section %}`` fragment."""
+    return make_template_fragment_key('homepage', [section])
+
+
+def _carousel_ids():
+    return list(Product.objects.values_list('id', flat=True)[:3])
+
+
+def _men_women_ids():
+    return list(
+        Product.objects.filter(
+            category__in=[Category.MENS_CLOTHING, Category.WOMENS_CLOTHING]
+        ).values_list('id', flat=True)[:12]
+    )
+
+
+def _discounted_ids():
+    return list(
+        Product.objects.filter(
+            id__in=Discount.objects.active().applies_to_products()
+        ).values_list('id', flat=True)[:12]
+    )
+
+
+def _other_ids():
+    # Everything not already shown in the men/women rail and not discounted
+    return list(
+        Product.objects.exclude(id__in=section_ids('men_women'))
+        .exclude(id__in=Discount.objects.active().applies_to_products())
+        .values_list('id', flat=True)[:12]
+    )
+
+
+_SECTION_BUILDERS = {
+    'carousel': _carousel_ids,
+    'men_women': _men_women_ids,
+    'discounted': _discounted_ids,
+    'other': _other_ids,
+}
+
+
+def section_ids(section):
+    """Return the cached product ids shown in ``section``, computing them on a miss."""
+    key = _ids_key(section)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _SECTION_BUILDERS[section]()
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+def section_products(section):
+    """Load the products of ``section`` in display order."""
+    ids = section_ids(section)
+    products = Product.objects.in_bulk(ids)
+    products = [products[pk] for pk in ids if pk in products]
+    if section == 'discounted':
+        attach_prices(products)
+    return products
+
+
+def lazy_section_products(section):
+    """
+    Products of ``section``, loaded only when first used. A cached template
+    fragment never touches them, so a warm home page runs no product queries.
+    """
+    return SimpleLazyObject(partial(section_products, section))
+
+
+def invalidate(sections=SECTIONS):
+    """Drop the cached ids and rendered fragments of ``sections``."""
+    cache.delete_many(
+        [_ids_key(section) for section in sections]
+        + [fragment_key(section) for section in sections]
+    )
+
+
+def invalidate_for_model(model):
+    invalidate(SECTION_DEPENDENCIES.get(model, SECTIONS))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.copurchase import TOP_K, update_copurchases
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the \"frequently bought together\" table from order items added since "
+        "the last run. Run nightly, with --full now and then."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="Rebuild from every order instead of only those since the last run.",
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=TOP_K,
+            help=f"Neighbours to keep per product (default {TOP_K}).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        run = update_copurchases(full=options['full'], top_k=options['top_k'])
+        elapsed = time.monotonic() - started
+        kind = "Rebuilt" if run.full else "Updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} co-purchases from {run.orders} orders "
+            f"(up to order item {run.last_item_id}) in {elapsed:.2f}s."
+        ))
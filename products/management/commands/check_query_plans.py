@@ -0,0 +1,88 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from cart.models import Order
+from products.models import Brand, Category, Product
+from products.views import ProductListView, ProductsListView
+
+# A plan line reading "SCAN <table>" with no index reads every row.
+FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+
+# Queries known to read every row, and why; reported instead of checked.
+# SQLite walks an index for them (created_at, or the list price for the
+# sorts), so the plan shows no SCAN of a bare table, but the current price
+# is computed and compared or sorted for every product on the way.
+_CURRENT_PRICE_SCAN = (
+    "filters or sorts on Coalesce(effective_price__amount, price), which no index "
+    "covers; products without a ProductPrice row still list at their list price"
+)
+KNOWN_SCANS = {
+    'storefront: price range': _CURRENT_PRICE_SCAN,
+    'storefront: price low to high': _CURRENT_PRICE_SCAN,
+    'storefront: price high to low': _CURRENT_PRICE_SCAN,
+}
+
+
+def _view_queryset(view_class, **params):
+    view = view_class()
+    view.setup(RequestFactory().get('/', params))
+    return view.get_queryset()
+
+
+def main_queries():
+    """The main query of each catalog and order view, by name."""
+    brand_id = Brand.objects.values_list('id', flat=True).first() or 0
+    product_id = Product.objects.values_list('id', flat=True).first() or 0
+    user_id = get_user_model().objects.values_list('id', flat=True).first() or 0
+    category = Category.SHOES
+    return {
+        'storefront: newest': _view_queryset(ProductsListView),
+        'storefront: category': _view_queryset(ProductsListView, category=category),
+        'storefront: brand': _view_queryset(ProductsListView, brand=brand_id),
+        'storefront: price range': _view_queryset(ProductsListView, min_price=10, max_price=50),
+        'storefront: price low to high': _view_queryset(ProductsListView, sort='price'),
+        'storefront: price high to low': _view_queryset(ProductsListView, sort='-price'),
+        'dashboard: category': _view_queryset(ProductListView, category=category),
+        'dashboard: brand': _view_queryset(ProductListView, brand=brand_id),
+        'dashboard: price range': _view_queryset(ProductListView, price_min=10, price_max=50),
+        'product detail: reviews': Product(pk=product_id).reviews.filter(approved=True).order_by('-created_at'),
+        'order list': Order.objects.filter(customer_id=user_id).order_by('-date'),
+        'order list: by total': Order.objects.filter(customer_id=user_id, total__gte=100).order_by('-total'),
+    }
+
+
+def full_scans(queryset):
+    """Tables the database would read in full to run ``queryset``."""
+    return [
+        match.group(1)
+        for line in queryset.explain().splitlines()
+        if (match := FULL_SCAN.search(line.strip()))
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN QUERY PLAN on the main query of each catalog and order view "
+        "and fail if any of them, other than the KNOWN_SCANS, falls back to a "
+        "full table scan."
+    )
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset in main_queries().items():
+            if name in KNOWN_SCANS:
+                self.stdout.write(self.style.WARNING(f"{name}: known scan ({KNOWN_SCANS[name]})"))
+                continue
+            tables = full_scans(queryset)
+            if tables:
+                failures.append(f"{name}: full scan of {', '.join(tables)}")
+                self.stdout.write(self.style.ERROR(f"{name}: full scan of {', '.join(tables)}"))
+            else:
+                self.stdout.write(f"{name}: ok")
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries fall back to a full scan.")
+        self.stdout.write(self.style.SUCCESS("All query plans use an index."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.ratings import refresh_review_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's review count, rating sum and rating histogram."
+
+    def handle(self, *args, **options):
+        written = refresh_review_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt review stats for {written} products."))
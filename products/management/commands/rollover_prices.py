@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from products import facets, homepage
+from products.models import Discount, Product, ProductPrice
+from products.pricing import discount_product_ids, refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Reprice products whose discounts started or expired since they were last "
+        "priced. Run once a day, shortly after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', type=date.fromisoformat,
+            help="Price as of this date (YYYY-MM-DD). Defaults to today.",
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Reprice every product instead of only those affected by a boundary.",
+        )
+
+    def handle(self, *args, **options):
+        at = options['date'] or timezone.localdate()
+
+        if options['all']:
+            written = refresh_effective_prices(at=at)
+            homepage.invalidate()
+            facets.invalidate()
+            self.stdout.write(self.style.SUCCESS(f"Repriced all {written} products as of {at}."))
+            return
+
+        # Products that were never priced.
+        product_ids = set(
+            Product.objects.filter(effective_price__isnull=True).values_list('id', flat=True)
+        )
+
+        # Products covered by a discount whose window opened or closed since
+        # the oldest materialized price was computed.
+        since = ProductPrice.objects.aggregate(since=Min('priced_on'))['since']
+        if since is not None and since < at:
+            boundary_discounts = Discount.objects.filter(
+                Q(start_date__gt=since, start_date__lte=at)
+                | Q(end_date__gte=since, end_date__lt=at)
+            )
+            for discount in boundary_discounts:
+                product_ids |= discount_product_ids(discount)
+            if boundary_discounts:
+                # Discounts starting or ending change the home page rails too.
+                homepage.invalidate_for_model(Discount)
+
+        written = 0
+        if product_ids:
+            written = refresh_effective_prices(product_ids, at=at)
+            facets.invalidate()
+        # Everything else is unchanged; just mark it as current.
+        ProductPrice.objects.filter(priced_on__lt=at).update(priced_on=at)
+
+        self.stdout.write(self.style.SUCCESS(f"Repriced {written} products as of {at}."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_categories_to_targets(apps, schema_editor):
+    Discount = apps.get_model('products', 'Discount')
+    DiscountCategory = apps.get_model('products', 'DiscountCategory')
+    DiscountCategory.objects.bulk_create(
+        [
+            DiscountCategory(discount_id=discount.pk, category=category)
+            for discount in Discount.objects.all()
+            for category in set(discount.categories or [])
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def copy_targets_to_categories(apps, schema_editor):
+    Discount = apps.get_model('products', 'Discount')
+    for discount in Discount.objects.prefetch_related('category_targets'):
+        discount.categories = sorted(target.category for target in discount.category_targets.all())
+        discount.save(update_fields=['categories'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('MENS', "Men's Clothing"), ('WOMENS', "Women's Clothing"), ('KIDS', "Kids' Clothing"), ('SHOES', 'Shoes'), ('ACCESSORIES', 'Accessories'), ('ACTIVEWEAR', 'Activewear'), ('OUTERWEAR', 'Outerwear')], max_length=20)),
+                ('discount', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_targets', to='products.discount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'discount'], name='discount_category_lookup_idx')],
+                'constraints': [models.UniqueConstraint(fields=('discount', 'category'), name='unique_discount_category')],
+            },
+        ),
+        migrations.RunPython(copy_categories_to_targets, copy_targets_to_categories),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_discountcategory'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='discount',
+            name='categories',
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type = ContentType.objects.filter(app_label='products', model='product').first()
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE products_product_fts USING fts5("
+                "name, description, brand, tags, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to icontains.
+            return
+        cursor.execute(
+            """
+            INSERT INTO products_product_fts (rowid, name, description, brand, tags)
+            SELECT p.id, p.name, p.description, b.name,
+                   COALESCE((
+                       SELECT group_concat(t.name, ' ')
+                       FROM taggit_taggeditem ti
+                       JOIN taggit_tag t ON t.id = ti.tag_id
+                       WHERE ti.object_id = p.id AND ti.content_type_id = %s
+                   ), '')
+            FROM products_product p
+            JOIN products_brand b ON b.id = p.brand_id
+            """,
+            [content_type.id if content_type else None],
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS products_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('products', '0010_remove_discount_categories_json'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
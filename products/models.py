@@ -1,7 +1,7 @@
 from decimal import Decimal
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 import uuid
 from taggit.managers import TaggableManager
@@ -46,6 +46,10 @@ class Brand(models.Model):
 
 
 # PRODUCT
+# Review aggregates on Product; see products.ratings.
+REVIEW_STAT_FIELDS = ('review_count', 'rating_sum') + tuple(f'rating_{rating}_count' for rating in range(1, 6))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     category = models.CharField(max_length=20, choices=Category.choices, default=Category.MENS_CLOTHING)
@@ -56,31 +60,63 @@ class Product(models.Model):
     image = models.ImageField(upload_to=product_image_path, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Aggregates of the approved reviews, kept current by products.ratings
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Storefront and dashboard listings: newest first, optionally
+            # narrowed by category or brand, or by a price range.
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+            models.Index(fields=['brand', '-created_at', '-id'], name='product_brand_created_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.category})"
 
-    def get_active_discounts(self):
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # The review aggregates only change through F() deltas and refreshes
+        # in products.ratings. A save that does not name them would write back
+        # this instance's copies, which may predate a concurrent review, so
+        # its UPDATE leaves them out. If the row is gone, the INSERT Django
+        # falls back to still writes every field.
+        if update_fields is None:
+            values = [value for value in values if value[0].name not in REVIEW_STAT_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return 0
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def rating_histogram(self):
+        """``[{'rating': 5, 'count': n}, ..., {'rating': 1, 'count': n}]``"""
+        return [
+            {'rating': rating, 'count': getattr(self, f'rating_{rating}_count')}
+            for rating in range(5, 0, -1)
+        ]
+
+    def get_active_discounts(self, at=None):
         """Return all currently active discounts applicable to this product."""
-        now = timezone.now()
-        discounts = self.discounts.filter(active=True, start_date__lte=now).exclude(end_date__lt=now)
-        # Include brand discounts
-        for brand_discount in self.brand.discounts.filter(active=True, start_date__lte=now).exclude(end_date__lt=now):
-            discounts |= Discount.objects.filter(pk=brand_discount.pk)
-        # Include category discounts
-        for discount in Discount.objects.filter(active=True, start_date__lte=now):
-            if self.category in discount.categories:
-                discounts |= Discount.objects.filter(pk=discount.pk)
-        return discounts.distinct()
-
-    def get_discounted_price(self):
-        price = self.price
-        discounts = self.get_active_discounts()
-        for discount in discounts:
-            if discount.discount_type == Discount.PERCENTAGE:
-                price -= (price * discount.value / Decimal('100.0'))
-            elif discount.discount_type == Discount.FIXED:
-                price -= discount.value
-        return max(price, Decimal('0.0'))
+        return Discount.objects.active(at).filter(
+            models.Q(products=self)
+            | models.Q(brands=self.brand_id)
+            | models.Q(category_targets__category=self.category)
+        ).distinct()
+
+    def get_discounted_price(self, at=None):
+        discounts = Discount.objects.for_products([self], at=at)[self.pk]
+        return Discount.apply_all(self.price, discounts)
 
 
 # PRODUCT VARIANT
@@ -112,6 +148,82 @@ class ProductVariant(models.Model):
 
 
 # DISCOUNT
+class DiscountQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """Discounts switched on and running on the given date (default: today)."""
+        at = at or timezone.localdate()
+        return self.filter(active=True, start_date__lte=at).filter(
+            models.Q(end_date__isnull=True) | models.Q(end_date__gte=at)
+        )
+
+    def for_products(self, products, at=None):
+        """
+        Map each product id to the list of active discounts that apply to it,
+        in the order they are applied.
+
+        Product, brand and category targeting are resolved for the whole batch
+        at once, so the query count does not grow with the number of products.
+        """
+        products = list(products)
+        resolved = {product.pk: [] for product in products}
+        if not products:
+            return resolved
+
+        discounts = list(self.active(at))
+        if not discounts:
+            return resolved
+
+        discount_ids = [discount.pk for discount in discounts]
+        product_targets = set(
+            Discount.products.through.objects.filter(
+                discount_id__in=discount_ids, product_id__in=resolved.keys()
+            ).values_list('discount_id', 'product_id')
+        )
+        brand_targets = set(
+            Discount.brands.through.objects.filter(
+                discount_id__in=discount_ids,
+                brand_id__in={product.brand_id for product in products},
+            ).values_list('discount_id', 'brand_id')
+        )
+        category_targets = set(
+            DiscountCategory.objects.filter(
+                discount_id__in=discount_ids,
+                category__in={product.category for product in products},
+            ).values_list('discount_id', 'category')
+        )
+
+        for product in products:
+            resolved[product.pk] = [
+                discount for discount in discounts
+                if (discount.pk, product.pk) in product_targets
+                or (discount.pk, product.brand_id) in brand_targets
+                or (discount.pk, product.category) in category_targets
+            ]
+        return resolved
+
+    def applies_to_products(self):
+        """
+        Ids of every product covered by these discounts through product, brand
+        or category targeting, as a single query.
+
+        The result is a lazy ``values_list`` queryset, so it can also be used
+        directly as a subquery, e.g. ``Product.objects.filter(pk__in=...)``.
+        """
+        discounts = self.values('pk')
+        return Product.objects.filter(
+            models.Q(pk__in=Discount.products.through.objects.filter(
+                discount__in=discounts).values('product_id'))
+            | models.Q(brand_id__in=Discount.brands.through.objects.filter(
+                discount__in=discounts).values('brand_id'))
+            | models.Q(category__in=DiscountCategory.objects.filter(
+                discount__in=discounts).values('category'))
+        ).values_list('id', flat=True)
+
+    def for_category(self, category):
+        """Discounts targeting ``category``; combine with ``active()`` for today's."""
+        return self.filter(category_targets__category=category)
+
+
 class Discount(models.Model):
     # Discount types
     PERCENTAGE = 'PERCENTAGE'
@@ -148,14 +260,60 @@ class Discount(models.Model):
     # Relations
     products = models.ManyToManyField(Product, blank=True, related_name='discounts')
     brands = models.ManyToManyField(Brand, blank=True, related_name='discounts')
-    categories = models.JSONField(
-        blank=True, default=list,
-        help_text="List of categories (use Category enum values)"
-    )
+    # Targeted categories live in DiscountCategory; see the ``categories`` property.
+
+    objects = DiscountQuerySet.as_manager()
+
+    # Categories assigned through the ``categories`` property, written on save()
+    _pending_categories = None
 
     class Meta:
         ordering = ['-priority', 'name']
 
+    @property
+    def categories(self):
+        """List of targeted ``Category`` values."""
+        if self._pending_categories is not None:
+            return list(self._pending_categories)
+        if not self.pk:
+            return []
+        return [target.category for target in self.category_targets.all()]
+
+    @categories.setter
+    def categories(self, value):
+        self._pending_categories = list(dict.fromkeys(value or []))
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self._pending_categories is not None:
+                self._save_categories()
+
+    def _save_categories(self):
+        categories = self._pending_categories
+        self.category_targets.exclude(category__in=categories).delete()
+        DiscountCategory.objects.bulk_create(
+            [DiscountCategory(discount=self, category=category) for category in categories],
+            ignore_conflicts=True,
+        )
+        self._pending_categories = None
+        getattr(self, '_prefetched_objects_cache', {}).pop('category_targets', None)
+
+    def apply(self, price):
+        """Return ``price`` reduced by this discount."""
+        if self.discount_type == self.PERCENTAGE:
+            return price - (price * self.value / Decimal('100.0'))
+        if self.discount_type == self.FIXED:
+            return price - self.value
+        return price
+
+    @staticmethod
+    def apply_all(price, discounts):
+        """Apply ``discounts`` to ``price`` in order, never going below zero."""
+        for discount in discounts:
+            price = discount.apply(price)
+        return max(price, Decimal('0.0'))
+
     def is_active(self):
         """Check if discount is currently active based on dates and active flag."""
         today = timezone.now().date()  # convert to date
@@ -181,8 +339,59 @@ class Discount(models.Model):
         return f"{self.name} ({self.discount_type} - {self.value})"
 
 
+class DiscountCategory(models.Model):
+    """A category targeted by a discount, stored so it can be joined and indexed."""
+    discount = models.ForeignKey(Discount, on_delete=models.CASCADE, related_name='category_targets')
+    category = models.CharField(max_length=20, choices=Category.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['discount', 'category'], name='unique_discount_category'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'discount'], name='discount_category_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.discount_id} -> {self.category}"
+
+
+# EFFECTIVE PRICE
+class ProductPrice(models.Model):
+    """
+    Materialized price a customer pays for a product today, after discounts.
+
+    Kept current by the signal handlers in ``products.signals`` and rolled over
+    at date boundaries by the ``rollover_prices`` management command.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='effective_price'
+    )
+    amount = models.DecimalField(max_digits=8, decimal_places=2, db_index=True)
+    priced_on = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.amount} on {self.priced_on}"
+
 
 # PRODUCT REVIEW
+class ProductReviewQuerySet(models.QuerySet):
+    def set_approved(self, approved):
+        """
+        Approve or unapprove every review in the queryset in one UPDATE and
+        refresh the rating aggregates of the affected products.
+        """
+        from .ratings import refresh_review_stats
+
+        with transaction.atomic():
+            changed = self.exclude(approved=approved)
+            product_ids = set(changed.values_list('product_id', flat=True))
+            updated = changed.update(approved=approved)
+            refresh_review_stats(product_ids)
+        return updated
+
+
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
@@ -192,9 +401,59 @@ class ProductReview(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     approved = models.BooleanField(default=True)
 
+    objects = ProductReviewQuerySet.as_manager()
+
     class Meta:
         unique_together = ('product', 'user', 'variant')
+        indexes = [
+            # Approved reviews of a product, newest first. Partial, because
+            # SQLite can't seek on a bare boolean column in the WHERE clause.
+            models.Index(
+                fields=['product', '-created_at', '-id'],
+                condition=models.Q(approved=True),
+                name='review_product_approved_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The product's rating aggregates are updated from the save signals;
+        # keep them in the same transaction as the review itself.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         variant_info = f" - {self.variant.size}/{self.variant.color}" if self.variant else ""
         return f"{self.user.username} - {self.product.name}{variant_info} ({self.rating}⭐)"
+
+
+# FREQUENTLY BOUGHT TOGETHER
+class CoPurchase(models.Model):
+    """
+    ``related`` appeared in ``count`` orders together with ``product``.
+    Only each product's top neighbours are kept; see ``products.copurchase``.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchases')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_copurchase'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-count', 'related'], name='copurchase_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.count})"
+
+
+class CoPurchaseRun(models.Model):
+    """One run of the co-purchase job; the latest marks where the next one starts."""
+    last_item_id = models.PositiveBigIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    full = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Co-purchases up to order item {self.last_item_id}"
@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` a page is fetched as "the next ``per_page`` rows after
+this position", where the position is the ordering key of the last row seen.
+Every page costs the same as the first one, and no ``COUNT(*)`` is needed to
+render next/previous links. Cursors are opaque, URL-safe strings.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position, backwards=False):
+    payload = json.dumps([[str(value) for value in position], 'p' if backwards else 'n'])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(position, backwards)``; raise ``InvalidCursor`` if malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('n', 'p') or not isinstance(position, list):
+            raise ValueError(cursor)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+    return position, direction == 'p'
+
+
+class CursorPage:
+    """One page of a ``KeysetPaginator``; iterates over its objects."""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` on the unique key ``fields`` (default
+    ``created_at, id``), newest first unless ``descending`` is False.
+    The queryset's own ordering is replaced.
+    """
+
+    def __init__(self, queryset, per_page, fields=('created_at', 'id'), descending=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.fields = fields
+        self.descending = descending
+
+    def _order_by(self, backwards):
+        prefix = '-' if self.descending != backwards else ''
+        return [prefix + field for field in self.fields]
+
+    def _after(self, position, backwards):
+        """Rows strictly after ``position`` in the (possibly reversed) ordering."""
+        lookup = 'lt' if self.descending != backwards else 'gt'
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {f: position[j] for j, f in enumerate(self.fields[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[i]})
+        return condition
+
+    def _position(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _to_python(self, position):
+        if len(position) != len(self.fields):
+            raise InvalidCursor(position)
+        opts = self.queryset.model._meta
+        try:
+            return [
+                opts.get_field(field).to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (FieldDoesNotExist, ValidationError) as e:
+            raise InvalidCursor(position) from e
+
+    def page(self, cursor=None):
+        """
+        Return the page that starts after ``cursor`` (or the first page).
+        Raises ``InvalidCursor`` for cursors this paginator did not produce.
+        """
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            position, backwards = decode_cursor(cursor)
+            queryset = queryset.filter(self._after(self._to_python(position), backwards))
+
+        rows = list(queryset.order_by(*self._order_by(backwards))[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        # Walking forwards we can always go back once we've moved; walking
+        # backwards we can always go forwards again.
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else bool(cursor)
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._position(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._position(rows[0]), backwards=True)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
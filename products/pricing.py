@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Discount, Product, ProductPrice
+
+REFRESH_BATCH_SIZE = 500
+
+
+def price_products(products, at=None):
+    """
+    Return ``{product_id: discounted_price}`` for every product given.
+
+    Active discounts are loaded once for the whole batch, so pricing a page of
+    products costs the same handful of queries as pricing a single one.
+    """
+    products = list(products)
+    discounts = Discount.objects.for_products(products, at=at)
+    return {
+        product.pk: Discount.apply_all(product.price, discounts[product.pk])
+        for product in products
+    }
+
+
+def attach_prices(products, at=None):
+    """
+    Price ``products`` in one batch and set ``applied_discounts`` and
+    ``discounted_price`` on each instance for use in templates.
+
+    Returns the products as a list.
+    """
+    products = list(products)
+    discounts = Discount.objects.for_products(products, at=at)
+    for product in products:
+        product.applied_discounts = discounts[product.pk]
+        product.discounted_price = Discount.apply_all(product.price, product.applied_discounts)
+    return products
+
+
+def discount_product_ids(discount):
+    """Return the ids of every product a discount targets, active or not."""
+    return set(
+        Product.objects.filter(
+            Q(discounts=discount) | Q(brand__discounts=discount) | Q(category__in=discount.categories)
+        ).values_list('id', flat=True)
+    )
+
+
+def refresh_effective_prices(product_ids=None, at=None):
+    """
+    Recompute the materialized ``ProductPrice`` rows for ``product_ids``
+    (every product when ``None``) as of ``at`` and return how many were written.
+    """
+    at = at or timezone.localdate()
+    products = Product.objects.order_by('pk')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    written = 0
+    last_pk = 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk)[:REFRESH_BATCH_SIZE])
+        if not batch:
+            return written
+        prices = price_products(batch, at=at)
+        ProductPrice.objects.bulk_create(
+            [
+                ProductPrice(product_id=pk, amount=amount.quantize(Decimal('0.01')), priced_on=at)
+                for pk, amount in prices.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['amount', 'priced_on', 'updated_at'],
+        )
+        written += len(batch)
+        last_pk = batch[-1].pk
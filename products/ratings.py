@@ -0,0 +1,68 @@
+"""
+Review aggregates stored on ``Product``.
+
+``review_count``, ``rating_sum`` and ``rating_<n>_count`` summarise the
+approved reviews of a product so detail and listing pages can show ratings
+from the product row. ``products.signals`` applies each review change as an
+``F()`` delta in the review's own transaction; ``refresh_review_stats``
+recomputes them from scratch (bulk approvals, ``rebuild_review_stats``).
+"""
+from django.db.models import Count, F, Q, Sum
+
+from .models import REVIEW_STAT_FIELDS, Product, ProductReview
+
+RATINGS = range(1, 6)
+
+STAT_FIELDS = list(REVIEW_STAT_FIELDS)
+
+REFRESH_BATCH_SIZE = 500
+
+
+def apply_review_delta(product_id, rating, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) one approved review."""
+    changes = {
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+    }
+    if rating in RATINGS:
+        field = f'rating_{rating}_count'
+        changes[field] = F(field) + sign
+    Product.objects.filter(pk=product_id).update(**changes)
+
+
+def _aggregate(product_ids):
+    approved = ProductReview.objects.filter(approved=True, product_id__in=product_ids)
+    rows = approved.values('product_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{
+            f'rating_{rating}_count': Count('id', filter=Q(rating=rating))
+            for rating in RATINGS
+        },
+    ).order_by()
+    return {row.pop('product_id'): row for row in rows}
+
+
+def refresh_review_stats(product_ids=None):
+    """
+    Recompute the review aggregates of ``product_ids`` (every product when
+    ``None``) and return how many products were written.
+    """
+    products = Product.objects.order_by('pk').only('pk', *STAT_FIELDS)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    written = 0
+    last_pk = 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk)[:REFRESH_BATCH_SIZE])
+        if not batch:
+            return written
+        stats = _aggregate([product.pk for product in batch])
+        for product in batch:
+            row = stats.get(product.pk, {})
+            for field in STAT_FIELDS:
+                setattr(product, field, row.get(field) or 0)
+        Product.objects.bulk_update(batch, STAT_FIELDS)
+        written += len(batch)
+        last_pk = batch[-1].pk
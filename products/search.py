@@ -0,0 +1,123 @@
+"""
+Full-text product search backed by an SQLite FTS5 table.
+
+The ``products_product_fts`` virtual table (created by migration 0011) holds
+one row per product, keyed by product id, with the product name, description,
+brand name and tag names. It is kept in sync by the handlers in
+``products.signals`` and can be rebuilt with ``manage.py rebuild_search_index``.
+On databases without FTS5 every function here is a no-op and
+``ProductsListView`` falls back to ``icontains`` filtering.
+"""
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+FTS_TABLE = 'products_product_fts'
+
+# bm25() column weights: name, description, brand, tags
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+_INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, brand, tags)
+    SELECT p.id, p.name, p.description, b.name,
+           COALESCE((
+               SELECT group_concat(t.name, ' ')
+               FROM taggit_taggeditem ti
+               JOIN taggit_tag t ON t.id = ti.tag_id
+               WHERE ti.object_id = p.id AND ti.content_type_id = %s
+           ), '')
+    FROM products_product p
+    JOIN products_brand b ON b.id = p.brand_id
+"""
+
+_available = None
+
+
+def is_available():
+    """Whether the database has the FTS5 index (SQLite only)."""
+    global _available
+    if _available is None:
+        _available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must appear,
+    as a prefix, in some column. Returns ``''`` when there are no words.
+    """
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _content_type_id():
+    return ContentType.objects.get_for_model(Product).id
+
+
+def index_products(product_ids):
+    """(Re)index the given products."""
+    product_ids = list(product_ids)
+    if not product_ids or not is_available():
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+        cursor.execute(
+            f"{_INSERT_SQL} WHERE p.id IN ({placeholders})",
+            [_content_type_id(), *product_ids],
+        )
+
+
+def remove_products(product_ids):
+    """Drop the given products from the index."""
+    product_ids = list(product_ids)
+    if not product_ids or not is_available():
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+
+def rebuild():
+    """Rebuild the whole index and return the number of products indexed."""
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(_INSERT_SQL, [_content_type_id()])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search(queryset, query):
+    """
+    Filter a ``Product`` queryset down to full-text matches of ``query`` and
+    annotate each with ``search_rank`` (lower is better).
+
+    Returns ``None`` when full-text search is unavailable so callers can fall
+    back to ``icontains`` filtering.
+    """
+    if not is_available():
+        return None
+    expression = match_expression(query)
+    if not expression:
+        return queryset.annotate(search_rank=Value(0.0)).none()
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (expression,))
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {Product._meta.db_table}.id",
+            (expression,),
+        )
+    )
@@ -0,0 +1,207 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from taggit.models import Tag
+
+from . import facets, homepage, search
+from .models import Brand, Discount, Product, ProductReview
+from .pricing import discount_product_ids, refresh_effective_prices
+from .ratings import apply_review_delta
+
+
+def _schedule_price_refresh(product_ids):
+    """Refresh effective prices once the current transaction commits."""
+    product_ids = set(product_ids)
+    if product_ids:
+        transaction.on_commit(lambda: refresh_effective_prices(product_ids))
+
+
+# EFFECTIVE PRICES
+@receiver(post_migrate)
+def backfill_effective_prices(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Price the products that have no ``ProductPrice`` row yet (all of them
+    right after the table is created), so the storefront does not list them
+    at list price until ``rollover_prices`` runs. Runs once migrations are
+    complete, since pricing goes through the current models.
+    """
+    if sender.label != 'products' or using != DEFAULT_DB_ALIAS:
+        return
+    executor = MigrationExecutor(connections[using])
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        return
+    product_ids = list(Product.objects.filter(effective_price__isnull=True).values_list('pk', flat=True))
+    if product_ids:
+        refresh_effective_prices(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _schedule_price_refresh([instance.pk])
+
+
+@receiver(pre_save, sender=Discount)
+def discount_pre_save(sender, instance, raw=False, **kwargs):
+    # Remember who the discount covered before the edit, so products that
+    # drop out of its targeting are repriced too.
+    instance._previous_product_ids = set()
+    if not raw and instance.pk:
+        previous = Discount.objects.filter(pk=instance.pk).first()
+        if previous:
+            instance._previous_product_ids = discount_product_ids(previous)
+
+
+@receiver(post_save, sender=Discount)
+def discount_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        previous_ids = getattr(instance, '_previous_product_ids', set())
+        _schedule_price_refresh(previous_ids | discount_product_ids(instance))
+
+
+@receiver(pre_delete, sender=Discount)
+def discount_pre_delete(sender, instance, **kwargs):
+    instance._previous_product_ids = discount_product_ids(instance)
+
+
+@receiver(post_delete, sender=Discount)
+def discount_deleted(sender, instance, **kwargs):
+    _schedule_price_refresh(getattr(instance, '_previous_product_ids', set()))
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+def discount_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # product.discounts.add(...) and friends: only this product moves.
+        if action.startswith('post_'):
+            _schedule_price_refresh([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_product_ids = set(instance.products.values_list('id', flat=True))
+    elif action == 'post_clear':
+        _schedule_price_refresh(getattr(instance, '_cleared_product_ids', set()))
+    elif action in ('post_add', 'post_remove'):
+        _schedule_price_refresh(pk_set)
+
+
+@receiver(m2m_changed, sender=Discount.brands.through)
+def discount_brands_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # brand.discounts.add(...): every product of this brand moves.
+        if action.startswith('post_'):
+            _schedule_price_refresh(instance.products.values_list('id', flat=True))
+    elif action == 'pre_clear':
+        instance._cleared_product_ids = set(
+            Product.objects.filter(brand__discounts=instance).values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        _schedule_price_refresh(getattr(instance, '_cleared_product_ids', set()))
+    elif action in ('post_add', 'post_remove'):
+        _schedule_price_refresh(
+            Product.objects.filter(brand_id__in=pk_set).values_list('id', flat=True)
+        )
+
+
+# HOMEPAGE SECTIONS
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_homepage(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: homepage.invalidate_for_model(sender))
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+@receiver(m2m_changed, sender=Discount.brands.through)
+def invalidate_homepage_discount_targets(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(lambda: homepage.invalidate_for_model(Discount))
+
+
+# SEARCH INDEX
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.remove_products([product_id]))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def index_product_tags(sender, instance, action, **kwargs):
+    if isinstance(instance, Product) and action.startswith('post_'):
+        transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+@receiver(post_save, sender=Brand)
+def index_brand_products(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        product_ids = list(instance.products.values_list('id', flat=True))
+        transaction.on_commit(lambda: search.index_products(product_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def index_tag_products(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        product_ids = list(
+            Product.objects.filter(tags__id=instance.pk).values_list('id', flat=True)
+        )
+        transaction.on_commit(lambda: search.index_products(product_ids))
+
+
+# FACET COUNTS
+# Registered after the price handlers, so on commit the effective prices are
+# refreshed before the counts bucketed on them are dropped.
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Discount)
+def invalidate_facets(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(facets.invalidate)
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+@receiver(m2m_changed, sender=Discount.brands.through)
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_facets_m2m(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(facets.invalidate)
+
+
+# REVIEW AGGREGATES
+# Applied immediately rather than on commit: ProductReview.save() and
+# deletions are atomic, so the product row changes with the review.
+@receiver(pre_save, sender=ProductReview)
+def review_pre_save(sender, instance, raw=False, **kwargs):
+    instance._previous_review = None
+    if not raw and instance.pk:
+        instance._previous_review = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list('product_id', 'rating', 'approved')
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def review_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_review', None)
+    current = (instance.product_id, instance.rating, instance.approved)
+    if previous == current:
+        return
+    if previous and previous[2]:
+        apply_review_delta(previous[0], previous[1], -1)
+    if instance.approved:
+        apply_review_delta(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=ProductReview)
+def review_deleted(sender, instance, **kwargs):
+    if instance.approved:
+        apply_review_delta(instance.product_id, instance.rating, -1)
@@ -1,12 +1,24 @@
 from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
 from datetime import date, timedelta
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Brand, Product, ProductVariant, Discount, ProductReview, Category
+from .models import (
+    Brand, Product, ProductVariant, Discount, DiscountCategory, ProductReview, Category, ProductPrice,
+    CoPurchase,
+)
+from cart.models import Order, OrderItem
 from .forms import ProductForm, DiscountForm, ProductReviewForm
+from . import copurchase, facets, homepage
+from .pricing import price_products
 
 User = get_user_model()
 
@@ -16,6 +28,7 @@ class BaseTestCase(TestCase):
     """Base test case with common setup"""
     
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -194,6 +207,323 @@ class DiscountModelTest(BaseTestCase):
         self.assertTrue(discount.applies_to_product(self.product))
 
 
+class AppliesToProductsTest(BaseTestCase):
+    """Test set-based discount coverage"""
+
+    def test_applies_to_products_covers_every_target_type(self):
+        """Test product, brand and category targeting in one query"""
+        other_brand = Brand.objects.create(name='Other Brand')
+        direct = Product.objects.create(name='Direct', brand=other_brand, price=Decimal('10.00'), category=Category.SHOES)
+        by_category = Product.objects.create(name='Kids', brand=other_brand, price=Decimal('10.00'), category=Category.KIDS_CLOTHING)
+        Product.objects.create(name='Uncovered', brand=other_brand, price=Decimal('10.00'), category=Category.SHOES)
+
+        product_discount = Discount.objects.create(name='Direct', discount_type=Discount.FIXED, value=Decimal('1.00'))
+        product_discount.products.add(direct)
+        brand_discount = Discount.objects.create(name='Brand', discount_type=Discount.FIXED, value=Decimal('1.00'))
+        brand_discount.brands.add(self.brand)
+        Discount.objects.create(
+            name='Category', discount_type=Discount.FIXED, value=Decimal('1.00'),
+            categories=[Category.KIDS_CLOTHING]
+        )
+        Discount.objects.create(
+            name='Inactive', discount_type=Discount.FIXED, value=Decimal('1.00'), active=False,
+            categories=[Category.SHOES]
+        )
+
+        with self.assertNumQueries(1):
+            ids = set(Discount.objects.active().applies_to_products())
+        self.assertEqual(ids, {self.product.pk, direct.pk, by_category.pk})
+
+    def test_home_page_discounted_rail(self):
+        """Test the home page rail lists discounted products with their price"""
+        plain = Product.objects.create(name='Plain', brand=Brand.objects.create(name='Plain Brand'),
+                                       price=Decimal('10.00'), category=Category.SHOES,
+                                       image=SimpleUploadedFile("plain.jpg", b"file_content"))
+        discount = Discount.objects.create(name='Brand', discount_type=Discount.PERCENTAGE, value=Decimal('10.00'))
+        discount.brands.add(self.brand)
+
+        response = self.client.get(reverse('dashboard'))
+        discounted = response.context['discounted_products']
+        self.assertEqual(discounted, [self.product])
+        self.assertEqual(discounted[0].discounted_price, Decimal('90.00'))
+        self.assertEqual(list(response.context['other_products']), [plain])
+
+
+class PricingTest(BaseTestCase):
+    """Test batch discount resolution"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_brand = Brand.objects.create(name='Other Brand')
+        self.shoe = Product.objects.create(
+            name='Test Shoe',
+            brand=self.other_brand,
+            price=Decimal('50.00'),
+            category=Category.SHOES
+        )
+
+    def test_price_products_resolves_every_target_type(self):
+        """Test product, brand and category discounts in one batch"""
+        product_discount = Discount.objects.create(
+            name='Product Discount',
+            discount_type=Discount.FIXED,
+            value=Decimal('10.00'),
+            start_date=date.today()
+        )
+        product_discount.products.add(self.product)
+        brand_discount = Discount.objects.create(
+            name='Brand Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            start_date=date.today()
+        )
+        brand_discount.brands.add(self.other_brand)
+
+        prices = price_products([self.product, self.shoe])
+        self.assertEqual(prices[self.product.pk], Decimal('90.00'))
+        self.assertEqual(prices[self.shoe.pk], Decimal('45.00'))
+
+    def test_price_products_ignores_expired_category_discount(self):
+        """Test category discounts respect their end date"""
+        Discount.objects.create(
+            name='Old Category Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('50.00'),
+            start_date=date.today() - timedelta(days=30),
+            end_date=date.today() - timedelta(days=1),
+            categories=[Category.SHOES]
+        )
+        self.assertEqual(price_products([self.shoe])[self.shoe.pk], Decimal('50.00'))
+
+    def test_price_products_query_count_is_constant(self):
+        """Test pricing many products does not add queries per product"""
+        discount = Discount.objects.create(
+            name='Category Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            start_date=date.today(),
+            categories=[Category.MENS_CLOTHING]
+        )
+        discount.brands.add(self.brand)
+        for i in range(10):
+            Product.objects.create(name=f'Bulk {i}', brand=self.brand, price=Decimal('10.00'))
+
+        with self.assertNumQueries(5):
+            prices = price_products(Product.objects.all())
+        self.assertEqual(len(prices), 12)
+
+    def test_price_products_at_date(self):
+        """Test pricing for a date before the discount starts"""
+        discount = Discount.objects.create(
+            name='Future Discount',
+            discount_type=Discount.FIXED,
+            value=Decimal('10.00'),
+            start_date=date.today() + timedelta(days=7)
+        )
+        discount.products.add(self.product)
+        self.assertEqual(price_products([self.product])[self.product.pk], Decimal('100.00'))
+        self.assertEqual(
+            price_products([self.product], at=date.today() + timedelta(days=7))[self.product.pk],
+            Decimal('90.00')
+        )
+
+
+class DiscountCategoryTest(BaseTestCase):
+    """Test category targeting stored in DiscountCategory"""
+
+    def test_categories_are_stored_as_rows(self):
+        """Test assigning categories writes one row per category"""
+        discount = Discount.objects.create(
+            name='Category Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            categories=[Category.SHOES, Category.KIDS_CLOTHING, Category.SHOES]
+        )
+        self.assertEqual(
+            set(DiscountCategory.objects.filter(discount=discount).values_list('category', flat=True)),
+            {Category.SHOES, Category.KIDS_CLOTHING}
+        )
+
+        discount.categories = [Category.KIDS_CLOTHING]
+        discount.save()
+        discount = Discount.objects.get(pk=discount.pk)
+        self.assertEqual(discount.categories, [Category.KIDS_CLOTHING])
+
+    def test_for_category_lookup(self):
+        """Test finding today's discounts for a category"""
+        discount = Discount.objects.create(
+            name='Shoe Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            categories=[Category.SHOES]
+        )
+        Discount.objects.create(
+            name='Inactive Shoe Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            active=False,
+            categories=[Category.SHOES]
+        )
+        self.assertEqual(list(Discount.objects.active().for_category(Category.SHOES)), [discount])
+        self.assertFalse(Discount.objects.for_category(Category.ACCESSORIES).exists())
+
+    def test_discount_form_round_trips_categories(self):
+        """Test the dashboard form loads and saves categories"""
+        discount = Discount.objects.create(
+            name='Form Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('10.00'),
+            start_date=date.today(),
+            categories=[Category.SHOES]
+        )
+        form = DiscountForm(instance=discount)
+        self.assertEqual(form.initial['categories'], [Category.SHOES])
+
+        form = DiscountForm(instance=discount, data={
+            'name': 'Form Discount',
+            'discount_type': Discount.PERCENTAGE,
+            'value': '10.00',
+            'start_date': date.today(),
+            'active': True,
+            'categories': [Category.OUTERWEAR, Category.ACTIVEWEAR],
+            'priority': Discount.PRIORITY_CATEGORY
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(
+            sorted(Discount.objects.get(pk=discount.pk).categories),
+            [Category.ACTIVEWEAR, Category.OUTERWEAR]
+        )
+
+    def test_admin_form_saves_categories(self):
+        """Test the admin form saves categories through save_model"""
+        self.client.force_login(self.superuser)
+        response = self.client.post(reverse('admin:products_discount_add'), {
+            'name': 'Admin Discount',
+            'discount_type': Discount.FIXED,
+            'value': '5.00',
+            'start_date': date.today(),
+            'active': 'on',
+            'priority': Discount.PRIORITY_CATEGORY,
+            'categories': [Category.MENS_CLOTHING],
+        })
+        self.assertEqual(response.status_code, 302)
+        discount = Discount.objects.get(name='Admin Discount')
+        self.assertEqual(discount.categories, [Category.MENS_CLOTHING])
+        self.assertIn(discount, self.product.get_active_discounts())
+
+
+class EffectivePriceTest(BaseTestCase):
+    """Test the materialized effective price table"""
+
+    def effective_price(self, product=None):
+        product = product or self.product
+        return ProductPrice.objects.get(product=product).amount
+
+    def test_product_save_materializes_price(self):
+        """Test saving a product writes its effective price"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('120.00')
+            self.product.save()
+        self.assertEqual(self.effective_price(), Decimal('120.00'))
+
+    def test_migrate_backfills_missing_prices(self):
+        """Test migrate prices products that have no effective price yet"""
+        Discount.objects.create(
+            name='Category Discount',
+            discount_type=Discount.FIXED,
+            value=Decimal('10.00'),
+            start_date=date.today(),
+            categories=[Category.MENS_CLOTHING]
+        )
+        ProductPrice.objects.all().delete()
+        call_command('migrate', verbosity=0)
+        self.assertEqual(self.effective_price(), Decimal('90.00'))
+
+    def test_discount_m2m_changes_reprice(self):
+        """Test adding and removing discount targets reprices products"""
+        discount = Discount.objects.create(
+            name='Product Discount',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('25.00'),
+            start_date=date.today()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.products.add(self.product)
+        self.assertEqual(self.effective_price(), Decimal('75.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.products.clear()
+        self.assertEqual(self.effective_price(), Decimal('100.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.brands.add(self.brand)
+        self.assertEqual(self.effective_price(), Decimal('75.00'))
+
+    def test_discount_edit_and_delete_reprice(self):
+        """Test products leaving a discount's targeting are repriced"""
+        with self.captureOnCommitCallbacks(execute=True):
+            discount = Discount.objects.create(
+                name='Category Discount',
+                discount_type=Discount.FIXED,
+                value=Decimal('10.00'),
+                start_date=date.today(),
+                categories=[Category.MENS_CLOTHING]
+            )
+        self.assertEqual(self.effective_price(), Decimal('90.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.categories = [Category.SHOES]
+            discount.save()
+        self.assertEqual(self.effective_price(), Decimal('100.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.categories = [Category.MENS_CLOTHING]
+            discount.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.delete()
+        self.assertEqual(self.effective_price(), Decimal('100.00'))
+
+    def test_rollover_prices_command(self):
+        """Test the rollover command picks up discounts starting on the new date"""
+        tomorrow = date.today() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            discount = Discount.objects.create(
+                name='Tomorrow Discount',
+                discount_type=Discount.FIXED,
+                value=Decimal('20.00'),
+                start_date=tomorrow,
+                end_date=tomorrow
+            )
+            discount.products.add(self.product)
+        self.assertEqual(self.effective_price(), Decimal('100.00'))
+
+        call_command('rollover_prices', date=tomorrow, stdout=StringIO())
+        self.assertEqual(self.effective_price(), Decimal('80.00'))
+
+        call_command('rollover_prices', date=tomorrow + timedelta(days=1), stdout=StringIO())
+        self.assertEqual(self.effective_price(), Decimal('100.00'))
+
+    def test_listing_filters_and_sorts_by_effective_price(self):
+        """Test the storefront filters on the price customers pay"""
+        cheap = Product.objects.create(name='Cheap', brand=self.brand, price=Decimal('60.00'))
+        discount = Discount.objects.create(
+            name='Half Off',
+            discount_type=Discount.PERCENTAGE,
+            value=Decimal('50.00'),
+            start_date=date.today()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.products.add(self.product)
+        call_command('rollover_prices', stdout=StringIO())
+
+        response = self.client.get(reverse('all_products_list'), {'max_price': '55', 'sort': 'price'})
+        self.assertEqual(list(response.context['products']), [self.product])
+
+        response = self.client.get(reverse('all_products_list'), {'sort': '-price'})
+        self.assertEqual(list(response.context['products']), [cheap, self.product])
+
+
 class ProductVariantModelTest(BaseTestCase):
     """Test ProductVariant model"""
     
@@ -264,6 +594,226 @@ class ProductReviewModelTest(BaseTestCase):
         self.assertEqual(str(review), expected_str)
 
 
+class ReviewStatsTest(BaseTestCase):
+    """Test the review aggregates stored on Product"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user(
+            username='other', email='other@example.com', password='testpass123'
+        )
+        self.review = ProductReview.objects.create(product=self.product, user=self.user, rating=4)
+        ProductReview.objects.create(product=self.product, user=self.other_user, rating=2)
+
+    def assertStats(self, count, total, histogram):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, count)
+        self.assertEqual(self.product.rating_sum, total)
+        self.assertEqual([row['count'] for row in self.product.rating_histogram], histogram)
+
+    def test_create_edit_and_delete(self):
+        """Test each review change is applied to the product row"""
+        self.assertStats(2, 6, [0, 1, 0, 1, 0])
+        self.assertEqual(self.product.average_rating, 3.0)
+
+        self.review.rating = 5
+        self.review.save()
+        self.assertStats(2, 7, [1, 0, 0, 1, 0])
+
+        self.review.approved = False
+        self.review.save()
+        self.assertStats(1, 2, [0, 0, 0, 1, 0])
+
+        self.review.delete()
+        ProductReview.objects.filter(user=self.other_user).delete()
+        self.assertStats(0, 0, [0, 0, 0, 0, 0])
+        self.assertEqual(self.product.average_rating, 0)
+
+    def test_stale_product_save_keeps_aggregates(self):
+        """Test saving a product loaded before a review change does not undo it"""
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductReview.objects.create(product=self.product, user=self.superuser, rating=5)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertStats(3, 11, [1, 1, 0, 1, 0])
+        self.assertEqual(self.product.name, 'Renamed')
+
+    def test_product_save_writes_requested_aggregates(self):
+        """Test naming the aggregates, or saving a deleted product, writes them"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.review_count = 7
+        product.save(update_fields=['review_count'])
+        self.assertEqual(Product.objects.get(pk=product.pk).review_count, 7)
+
+        Product.objects.filter(pk=product.pk).delete()
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).review_count, 7)
+
+    def test_bulk_approval(self):
+        """Test set_approved and the admin actions refresh the aggregates"""
+        self.assertEqual(ProductReview.objects.all().set_approved(False), 2)
+        self.assertStats(0, 0, [0, 0, 0, 0, 0])
+
+        self.client.force_login(self.superuser)
+        self.client.post(reverse('admin:products_productreview_changelist'), {
+            'action': 'approve_reviews',
+            '_selected_action': [self.review.pk],
+        })
+        self.assertStats(1, 4, [0, 1, 0, 0, 0])
+
+    def test_rebuild_review_stats_command(self):
+        """Test the rebuild command recomputes drifted aggregates"""
+        Product.objects.update(review_count=0, rating_sum=0, rating_4_count=0)
+        out = StringIO()
+        call_command('rebuild_review_stats', stdout=out)
+        self.assertIn('Rebuilt review stats for 1 products', out.getvalue())
+        self.assertStats(2, 6, [0, 1, 0, 1, 0])
+
+    def test_detail_page_reads_product_row(self):
+        """Test the detail page runs no rating aggregate queries"""
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product_detail', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.context['total_reviews'], 2)
+        self.assertEqual(response.context['avg_rating'], 3.0)
+        self.assertFalse(any(
+            'AVG(' in q['sql'] or 'GROUP BY' in q['sql'] for q in queries.captured_queries
+        ))
+
+
+class CoPurchaseTest(BaseTestCase):
+    """Test the frequently-bought-together job"""
+
+    def setUp(self):
+        super().setUp()
+        self.shirt = Product.objects.create(name='Shirt', brand=self.brand, price=Decimal('20.00'))
+        self.socks = Product.objects.create(name='Socks', brand=self.brand, price=Decimal('5.00'))
+        self.socks_variant = ProductVariant.objects.create(product=self.socks, size='M', color='RED')
+
+    def order(self, *products, variants=()):
+        order = Order.objects.create(customer=self.user, destination='Kampala')
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+        for variant in variants:
+            OrderItem.objects.create(order=order, product_variant=variant, quantity=1)
+        return order
+
+    def neighbours(self, product):
+        return list(
+            CoPurchase.objects.filter(product=product)
+            .order_by('-count', 'related_id').values_list('related_id', 'count')
+        )
+
+    def test_count_pairs(self):
+        """Test co-occurrence counting, duplicates and oversized orders"""
+        products, related, counts = copurchase.count_pairs(
+            [1, 1, 1, 1, 2, 2, 3, 3, 3], [10, 20, 20, 30, 10, 20, 10, 30, 40],
+            max_order_products=2,
+        )
+        self.assertEqual(
+            list(zip(products.tolist(), related.tolist(), counts.tolist())),
+            [(10, 20, 1), (20, 10, 1)],
+        )
+        products, related, counts = copurchase.count_pairs([1, 1, 1, 2, 2], [10, 20, 30, 10, 20])
+        pairs = dict(zip(zip(products.tolist(), related.tolist()), counts.tolist()))
+        self.assertEqual(pairs, {(10, 20): 2, (20, 10): 2, (10, 30): 1, (30, 10): 1, (20, 30): 1, (30, 20): 1})
+
+    def test_incremental_runs_match_full_rebuild(self):
+        """Test later runs only fold in new orders"""
+        self.order(self.product, self.shirt)
+        self.order(self.product, self.shirt, variants=[self.socks_variant])
+        out = StringIO()
+        call_command('build_copurchases', stdout=out)
+        self.assertIn('Rebuilt co-purchases from 2 orders', out.getvalue())
+        self.assertEqual(self.neighbours(self.product), [(self.shirt.pk, 2), (self.socks.pk, 1)])
+
+        self.order(self.product, self.socks)
+        out = StringIO()
+        call_command('build_copurchases', stdout=out)
+        self.assertIn('Updated co-purchases from 1 orders', out.getvalue())
+        incremental = self.neighbours(self.product)
+        self.assertEqual(incremental, [(self.shirt.pk, 2), (self.socks.pk, 2)])
+
+        call_command('build_copurchases', full=True, stdout=StringIO())
+        self.assertEqual(self.neighbours(self.product), incremental)
+        self.assertEqual(self.neighbours(self.socks), [(self.product.pk, 2), (self.shirt.pk, 1)])
+
+    def test_items_added_to_existing_orders(self):
+        """Test items added to an order after a run are counted by the next one"""
+        order = self.order(self.product, self.shirt)
+        call_command('build_copurchases', stdout=StringIO())
+        OrderItem.objects.create(order=order, product=self.socks, quantity=1)
+        OrderItem.objects.create(order=order, product=self.shirt, quantity=1)
+        out = StringIO()
+        call_command('build_copurchases', stdout=out)
+        self.assertIn('Updated co-purchases from 1 orders', out.getvalue())
+        incremental = self.neighbours(self.product)
+        self.assertEqual(incremental, [(self.shirt.pk, 1), (self.socks.pk, 1)])
+
+        call_command('build_copurchases', full=True, stdout=StringIO())
+        self.assertEqual(self.neighbours(self.product), incremental)
+        self.assertEqual(self.neighbours(self.shirt), [(self.product.pk, 1), (self.socks.pk, 1)])
+
+    def test_top_k(self):
+        """Test only the strongest neighbours are kept"""
+        self.order(self.product, self.shirt)
+        self.order(self.product, self.shirt, self.socks)
+        call_command('build_copurchases', top_k=1, stdout=StringIO())
+        self.assertEqual(self.neighbours(self.product), [(self.shirt.pk, 2)])
+
+    def test_detail_page_shows_copurchases(self):
+        """Test the detail page prefers co-purchases to same-brand products"""
+        self.order(self.product, self.socks)
+        call_command('build_copurchases', stdout=StringIO())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('product_detail', kwargs={'pk': self.product.pk}))
+        self.assertEqual(list(response.context['related_products']), [self.socks])
+
+
+class ReviewPaginationTest(BaseTestCase):
+    """Test paginated review loading on the detail page"""
+
+    def setUp(self):
+        super().setUp()
+        variant = ProductVariant.objects.create(product=self.product, size='M', color='RED')
+        for i in range(25):
+            reviewer = User.objects.create(username=f'reviewer{i}', email=f'reviewer{i}@example.com')
+            ProductReview.objects.create(
+                product=self.product, user=reviewer, variant=variant if i % 2 else None,
+                rating=i % 5 + 1, comment=f'Review {i}'
+            )
+        ProductReview.objects.create(product=self.product, user=self.user, approved=False, comment='Hidden')
+        self.client.force_login(self.user)
+
+    def test_detail_page_inlines_first_page(self):
+        """Test the detail page renders only the newest reviews"""
+        response = self.client.get(reverse('product_detail', kwargs={'pk': self.product.pk}))
+        page = response.context['reviews_page']
+        self.assertEqual([r.comment for r in page], [f'Review {i}' for i in range(24, 14, -1)])
+        self.assertContains(response, 'Load more reviews')
+
+    def test_endpoint_walks_remaining_pages(self):
+        """Test later pages come from the reviews endpoint in bounded queries"""
+        url = reverse('product_reviews', kwargs={'pk': self.product.pk})
+        cursor = self.client.get(
+            reverse('product_detail', kwargs={'pk': self.product.pk})
+        ).context['reviews_page'].next_cursor
+        comments = []
+        while cursor:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'cursor': cursor})
+            page = response.context['reviews_page']
+            comments += [r.comment for r in page]
+            cursor = page.next_cursor
+        self.assertEqual(comments, [f'Review {i}' for i in range(14, -1, -1)])
+        self.assertNotContains(response, 'Load more reviews')
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is a 404"""
+        url = reverse('product_reviews', kwargs={'pk': self.product.pk})
+        self.assertEqual(self.client.get(url, {'cursor': 'nope'}).status_code, 404)
+
+
 class ProductViewTest(BaseTestCase):
     """Test Product views"""
     
@@ -315,6 +865,283 @@ class HomePageViewTest(BaseTestCase):
         self.assertIn('categories', response.context)
 
 
+class HomePageCacheTest(BaseTestCase):
+    """Test cached home page sections"""
+
+    def product_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'products_' in q['sql']]
+
+    def test_warm_home_page_skips_product_queries(self):
+        """Test a second visit is served from cached fragments"""
+        self.assertTrue(self.product_queries())
+        self.assertEqual(self.product_queries(), [])
+
+    def test_product_save_invalidates_sections(self):
+        """Test saving a product refreshes the cached rails"""
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed Product'
+            self.product.save()
+        self.assertContains(self.client.get(reverse('dashboard')), 'Renamed Product')
+
+    def test_discount_change_invalidates_discounted_section(self):
+        """Test discount targeting changes refresh the Special Offers rail"""
+        self.assertEqual(self.client.get(reverse('dashboard')).context['discounted_products'], [])
+        discount = Discount.objects.create(name='Brand', discount_type=Discount.PERCENTAGE, value=Decimal('10.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.brands.add(self.brand)
+        self.assertContains(self.client.get(reverse('dashboard')), 'Ugx. 90')
+
+    def test_rollover_invalidates_started_discounts(self):
+        """Test the date rollover refreshes sections when a discount starts"""
+        tomorrow = date.today() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            discount = Discount.objects.create(
+                name='Tomorrow', discount_type=Discount.FIXED, value=Decimal('10.00'), start_date=tomorrow
+            )
+            discount.products.add(self.product)
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(homepage.section_ids('discounted'), [])
+
+        with patch('products.models.timezone.localdate', return_value=tomorrow):
+            call_command('rollover_prices', date=tomorrow, stdout=StringIO())
+            self.assertEqual(homepage.section_ids('discounted'), [self.product.pk])
+
+
+class ProductSearchTest(BaseTestCase):
+    """Test full-text product search"""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jacket = Product.objects.create(
+                name='Leather Jacket', brand=self.brand, price=Decimal('80.00'),
+                description='Warm winter outerwear'
+            )
+            self.scarf = Product.objects.create(
+                name='Wool Scarf', brand=Brand.objects.create(name='Nordic'), price=Decimal('20.00'),
+                description='Goes well with a leather jacket'
+            )
+            self.scarf.tags.add('winter')
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('all_products_list'), {'q': q, **params})
+        return list(response.context['products'])
+
+    def test_search_matches_every_indexed_field(self):
+        """Test name prefixes, description, brand and tags are searchable"""
+        self.assertEqual(self.search('leath'), [self.jacket, self.scarf])
+        self.assertEqual(self.search('nordic'), [self.scarf])
+        self.assertEqual(self.search('winter'), [self.scarf, self.jacket])
+        self.assertEqual(self.search('wool winter'), [self.scarf])
+        self.assertEqual(self.search('"!!'), [])
+
+    def test_search_ranks_name_matches_first(self):
+        """Test relevance ordering and explicit sort override"""
+        self.assertEqual(self.search('jacket'), [self.jacket, self.scarf])
+        self.assertEqual(self.search('jacket', sort='price'), [self.scarf, self.jacket])
+
+    def test_index_follows_renames(self):
+        """Test brand and tag renames reach the index"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = 'Atelier'
+            self.brand.save()
+        self.assertEqual(self.search('atelier'), [self.product, self.jacket])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scarf.tags.clear()
+        self.assertEqual(self.search('winter'), [self.jacket])
+
+    def test_rebuild_search_index_command(self):
+        """Test the rebuild command indexes every product"""
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 products', out.getvalue())
+
+    def test_icontains_fallback(self):
+        """Test search without FTS support"""
+        with patch('products.search.is_available', return_value=False):
+            self.assertEqual(set(self.search('winter')), {self.jacket, self.scarf})
+
+
+class ProductListPaginationTest(BaseTestCase):
+    """Test keyset pagination of the storefront product list"""
+
+    def setUp(self):
+        super().setUp()
+        other = Brand.objects.create(name='Other')
+        for i in range(25):
+            Product.objects.create(
+                name=f'Item {i}', brand=other if i % 2 else self.brand,
+                price=Decimal('10.00') + i
+            )
+
+    def get(self, **params):
+        return self.client.get(reverse('all_products_list'), params)
+
+    def test_cursor_walk_covers_every_product_once(self):
+        """Test next and previous cursors walk the list newest first"""
+        expected = list(Product.objects.order_by('-created_at', '-id'))
+        seen, pages, response = [], [], self.get()
+        while True:
+            page = response.context['page_obj']
+            pages.append(list(page))
+            seen += list(page)
+            if not page.has_next():
+                break
+            response = self.get(cursor=page.next_cursor)
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(p) for p in pages], [12, 12, 2])
+
+        previous = self.get(cursor=response.context['page_obj'].previous_cursor)
+        self.assertEqual(list(previous.context['page_obj']), pages[1])
+        first = self.get(cursor=previous.context['page_obj'].previous_cursor)
+        self.assertEqual(list(first.context['page_obj']), pages[0])
+        self.assertFalse(first.context['page_obj'].has_previous())
+
+    def test_cursor_respects_filters(self):
+        """Test cursors page through a filtered list"""
+        expected = list(
+            Product.objects.filter(brand=self.brand, price__gte=10).order_by('-created_at', '-id')
+        )
+        self.assertGreater(len(expected), 12)
+        params = {'brand': self.brand.id, 'min_price': 10}
+        first = self.get(**params)
+        self.assertIn(f'brand={self.brand.id}', first.context['querystring'])
+        second = self.get(cursor=first.context['page_obj'].next_cursor, **params)
+        self.assertEqual(list(first.context['products']) + list(second.context['products']), expected)
+
+    def test_count_only_on_request(self):
+        """Test the list skips COUNT(*) unless ?count=1"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertNotIn('total_count', response.context)
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(self.get(count=1).context['total_count'], 26)
+
+    def test_price_sort_keeps_numbered_pages(self):
+        """Test non-chronological sorts still use page numbers"""
+        response = self.get(sort='price', page=3)
+        self.assertFalse(response.context['cursor_pagination'])
+        self.assertEqual(len(response.context['products']), 2)
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is a 404"""
+        self.assertEqual(self.get(cursor='garbage').status_code, 404)
+
+
+class ProductFacetTest(BaseTestCase):
+    """Test facet counts on the storefront product list"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = Brand.objects.create(name='Other')
+        self.empty = Brand.objects.create(name='Empty')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Boot', brand=self.other, category=Category.SHOES, price=Decimal('60.00'))
+            Product.objects.create(name='Sneaker', brand=self.other, category=Category.SHOES, price=Decimal('30.00'))
+            Product.objects.create(name='Cap', brand=self.brand, category=Category.ACCESSORIES, price=Decimal('10.00'))
+
+    def get(self, **params):
+        return self.client.get(reverse('all_products_list'), params).context
+
+    def test_counts_hide_empty_options(self):
+        """Test per-category, per-brand and price bucket counts"""
+        context = self.get()
+        self.assertEqual(
+            [(b.name, b.product_count) for b in context['brands']],
+            [('Other', 2), ('Test Brand', 2)],
+        )
+        categories = {value: count for value, label, count in context['categories']}
+        self.assertEqual(categories, {Category.MENS_CLOTHING: 1, Category.SHOES: 2, Category.ACCESSORIES: 1})
+        self.assertEqual(
+            [(b['low'], b['high'], b['count']) for b in context['price_buckets']],
+            [
+                (None, Decimal('25'), 1), (Decimal('25'), Decimal('50'), 1),
+                (Decimal('50'), Decimal('100'), 1), (Decimal('100'), Decimal('200'), 1),
+            ],
+        )
+
+    def test_selection_filters_other_facets(self):
+        """Test a brand selection narrows categories but not brands"""
+        context = self.get(brand=self.other.id)
+        self.assertEqual(
+            [(b.name, b.product_count) for b in context['brands']],
+            [('Other', 2), ('Test Brand', 2)],
+        )
+        self.assertEqual([(v, c) for v, label, c in context['categories']], [(Category.SHOES, 2)])
+        self.assertEqual([b['count'] for b in context['price_buckets']], [1, 1])
+
+    def test_counts_follow_search_and_price(self):
+        """Test counts are computed over searched, price-filtered products"""
+        context = self.get(q='boot')
+        self.assertEqual([(b.name, b.product_count) for b in context['brands']], [('Other', 1)])
+        context = self.get(min_price='5', max_price='50')
+        self.assertEqual(
+            [(b.name, b.product_count) for b in context['brands']],
+            [('Other', 1), ('Test Brand', 1)],
+        )
+
+    def test_bucket_links_match_bucket_counts(self):
+        """Test a bucket link lists exactly the products the bucket counts"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Belt', brand=self.brand, category=Category.ACCESSORIES, price=Decimal('25.00'))
+        buckets = self.get()['price_buckets']
+        self.assertEqual([b['count'] for b in buckets[:2]], [1, 2])
+        for bucket in buckets:
+            response = self.client.get(f"{reverse('all_products_list')}?{bucket['querystring']}")
+            self.assertEqual(len(response.context['products']), bucket['count'])
+        context = self.get(price_bucket='0')
+        self.assertEqual([p.name for p in context['products']], ['Cap'])
+        """Test one grouped query per filter key, dropped on product changes"""
+        self.get(brand=self.brand.id, min_price='0')
+        with CaptureQueriesContext(connection) as queries:
+            self.get(category=Category.SHOES, min_price='0.0')
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(facets.cache_key(min_price='0.0'), facets.cache_key(min_price='0'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Belt', brand=self.empty, category=Category.ACCESSORIES, price=Decimal('15.00'))
+        context = self.get()
+        self.assertIn('Empty', [b.name for b in context['brands']])
+
+
+class QueryPlanTest(BaseTestCase):
+    """Test the catalog's main queries are served by indexes"""
+
+    def setUp(self):
+        super().setUp()
+        brands = [Brand.objects.create(name=f'Brand {i}') for i in range(5)]
+        categories = [value for value, label in Category.choices]
+        Product.objects.bulk_create(
+            Product(
+                name=f'Item {i}', brand=brands[i % 5], category=categories[i % len(categories)],
+                price=Decimal(i % 200)
+            )
+            for i in range(500)
+        )
+        ProductReview.objects.create(product=self.product, user=self.user, rating=4)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_main_queries_use_indexes(self):
+        """Test check_query_plans passes on a seeded catalog"""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('All query plans use an index.', out.getvalue())
+        self.assertIn('storefront: price range: known scan', out.getvalue())
+
+    def test_full_scan_is_reported(self):
+        """Test an unindexed filter fails the check"""
+        unindexed = {'by description': Product.objects.filter(description='x')}
+        with patch('products.management.commands.check_query_plans.main_queries', return_value=unindexed):
+            with self.assertRaises(CommandError):
+                call_command('check_query_plans', stdout=StringIO())
+
+
 class ProductFormTest(BaseTestCase):
     """Test Product forms"""
     
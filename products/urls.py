@@ -12,6 +12,7 @@ urlpatterns = [
     # Dashboard
     path('', HomePageView.as_view(), name='dashboard'),
     path('product/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
+    path('product/<int:pk>/reviews/', views.product_reviews, name='product_reviews'),
     path("products/", ProductsListView.as_view(), name="all_products_list"),
 
     # Brands
@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -9,6 +11,9 @@ from django.db.models import Q, Avg, Count
 from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Brand, Product, ProductVariant, Discount, ProductReview, Category
 from .forms import BrandForm, ProductForm, ProductVariantForm, DiscountForm, ProductReviewForm
+from . import facets, homepage, search
+from .pagination import InvalidCursor, KeysetPaginator
+from .pricing import attach_prices
 
 
 from django.views.generic import TemplateView
@@ -17,7 +22,7 @@ from .models import Product, Discount, Brand, Category
 
 
 from django.db.models import Count, F
-from django.db.models.functions import TruncDate
+from django.db.models.functions import Coalesce, TruncDate
 from django.shortcuts import render
 import matplotlib.pyplot as plt
 import io
@@ -78,29 +83,17 @@ class DiscountListView(LoginRequiredMixin, ListView):
         
 class HomePageView(TemplateView):
     template_name = 'dashboard/pages/home.html'
+    query_budget = 13
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Carousel: first 3 products
-        context['carousel_products'] = Product.objects.all()[:3]
-
-        # Group 1: Men’s & Women’s Clothing
-        context['men_women_products'] = Product.objects.filter(
-            Q(category=Category.MENS_CLOTHING) | Q(category=Category.WOMENS_CLOTHING)
-        )[:12]  # limit to 12 for homepage
-
-        # Group 2: Discounted Products
-        all_discounts = Discount.objects.filter(active=True)
-        discounted_products = []
-        for product in Product.objects.all():
-            if any(d.applies_to_product(product) for d in all_discounts):
-                discounted_products.append(product)
-        context['discounted_products'] = discounted_products[:12]
-
-        # Group 3: Others (everything not in men/women or discounted)
-        excluded_ids = [p.id for p in context['men_women_products']] + [p.id for p in discounted_products]
-        context['other_products'] = Product.objects.exclude(id__in=excluded_ids)[:12]
+        # Carousel, Men’s & Women’s Clothing, Discounted Products and Others.
+        # Each section is cached (see products.homepage) and only loaded from
+        # the database when its rendered fragment is not in the cache.
+        for section in homepage.SECTIONS:
+            context[f'{section}_products'] = homepage.lazy_section_products(section)
+        context['homepage_cache_timeout'] = homepage.CACHE_TIMEOUT
 
         # Categories: instead of brands, let’s keep it to Category enums for navigation
         context['categories'] = Category.choices
@@ -117,6 +110,7 @@ class BrandListView(LoginRequiredMixin, ListView):
     model = Brand
     template_name = 'dashboard/brands/brand_list.html'
     context_object_name = 'brands'
+    query_budget = 4
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -155,9 +149,10 @@ class ProductListView(LoginRequiredMixin, ListView):
     model = Product
     template_name = 'dashboard/products/product_list.html'
     context_object_name = 'products'
+    query_budget = 6
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().select_related('brand').prefetch_related('variants', 'tags')
         brand = self.request.GET.get('brand')
         category = self.request.GET.get('category')
         price_min = self.request.GET.get('price_min')
@@ -177,6 +172,12 @@ class ProductListView(LoginRequiredMixin, ListView):
 
         return qs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        for product in context['products']:
+            product.total_variant_stock = sum(variant.stock for variant in product.variants.all())
+        return context
+
 
 class ProductCreateView(LoginRequiredMixin, CreateView):
     login_url = 'login'
@@ -285,6 +286,8 @@ class DiscountListView(LoginRequiredMixin, ListView):
     model = Discount
     template_name = 'dashboard/discounts/discount_list.html'
     context_object_name = 'discounts'
+    queryset = Discount.objects.prefetch_related('products', 'brands', 'category_targets')
+    query_budget = 7
 
 
 class DiscountCreateView(LoginRequiredMixin, CreateView):
@@ -314,53 +317,40 @@ class ProductDetailView(DetailView):
     model = Product
     template_name = 'dashboard/pages/product_detail.html'
     context_object_name = 'product'
+    queryset = Product.objects.select_related('brand')
+    query_budget = 13
 
 
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
+        product = self.object
 
         # Variants
-        context['variants'] = product.variants.all()
-
-        # Approved Reviews
-        reviews_qs = product.reviews.filter(approved=True)
-        context['reviews'] = reviews_qs
-
-        # Rating statistics
-        total_reviews = reviews_qs.count()
-        avg_rating = reviews_qs.aggregate(Avg('rating'))['rating__avg'] or 0
-
-        # Count reviews per rating (1-5)
-        rating_counts = reviews_qs.values('rating').annotate(count=Count('rating')).order_by('-rating')
-
-        # Create a dictionary for an easy lookup
-        rating_dict = {item['rating']: item['count'] for item in rating_counts}
-
-        # Prepare data for all ratings (5 down to 1)
-        rating_stats = []
-        for rating in range(5, 0, -1):
-            count = rating_dict.get(rating, 0)
-            rating_stats.append({
-                'rating': rating,
-                'count': count
-            })
-
-        context['rating_stats'] = rating_stats
-        context['total_reviews'] = total_reviews
-        context['avg_rating'] = round(avg_rating, 1)
-
-        # Active discounts
-        context['discounts'] = product.get_active_discounts()
-
-        # Discounted price
-        context['discounted_price'] = product.get_discounted_price()
-
-        # Related products
-        related = Product.objects.filter(brand=product.brand).exclude(id=product.id)[:4]
-        if not related.exists() and product.category:
-            related = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+        context['variants'] = list(product.variants.all())
+
+        # First page of approved reviews; later pages come from product_reviews
+        context['reviews_page'] = _review_page(product.pk)
+
+        # Rating statistics, stored on the product row
+        context['rating_stats'] = product.rating_histogram
+        context['total_reviews'] = product.review_count
+        context['avg_rating'] = product.average_rating
+
+        # Active discounts and discounted price, resolved together
+        attach_prices([product])
+        context['discounts'] = product.applied_discounts
+        context['discounted_price'] = product.discounted_price
+
+        # Related products: frequently bought together, else same brand or category
+        related = [
+            copurchase.related
+            for copurchase in product.copurchases.select_related('related').order_by('-count', 'related_id')[:4]
+        ]
+        if not related:
+            related = list(Product.objects.filter(brand=product.brand).exclude(id=product.id)[:4])
+        if not related and product.category:
+            related = list(Product.objects.filter(category=product.category).exclude(id=product.id)[:4])
         context['related_products'] = related
 
         # Review form
@@ -369,7 +359,7 @@ class ProductDetailView(DetailView):
 
     def post(self, request, *args, **kwargs):
         """Handle review submission from logged-in users"""
-        product = self.get_object()
+        self.object = product = self.get_object()
         form = ProductReviewForm(request.POST, product=product)
 
         if form.is_valid():
@@ -383,23 +373,83 @@ class ProductDetailView(DetailView):
         context['review_form'] = form
         return self.render_to_response(context)
 
+
+REVIEWS_PER_PAGE = 10
+
+
+def _review_page(product_id, cursor=None):
+    """A page of a product's approved reviews, newest first, with user and variant joined."""
+    reviews = ProductReview.objects.filter(product_id=product_id, approved=True).select_related('user', 'variant')
+    return KeysetPaginator(reviews, REVIEWS_PER_PAGE).page(cursor)
+
+
+def product_reviews(request, pk):
+    """Render the next page of a product's reviews for the detail page."""
+    try:
+        page = _review_page(pk, request.GET.get("cursor"))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    # Rendered without the request: the fragment needs no context processors
+    # (cart, user), which keeps each page to a single query.
+    return HttpResponse(render_to_string('partials/review_cards.html', {'reviews_page': page, 'product_id': pk}))
+
+
 class ProductsListView(ListView):
     model = Product
     template_name = "dashboard/pages/product_list.html"
     context_object_name = "products"
     paginate_by = 12  # 12 products per page
+    query_budget = 7
 
-    def get_queryset(self):
-        queryset = Product.objects.all().order_by("-created_at")
+    sort_options = {
+        "newest": ("-created_at", "-id"),
+        "price": ("current_price", "id"),
+        "-price": ("-current_price", "-id"),
+    }
 
-        # Search
+    def get_queryset(self):
+        # current_price is the materialized price after discounts; products
+        # not yet priced fall back to their list price.
+        queryset = Product.objects.annotate(
+            current_price=Coalesce("effective_price__amount", "price")
+        )
+        sort = self.request.GET.get("sort")
+        if sort not in self.sort_options:
+            sort = None
+        queryset = queryset.order_by(*self.sort_options[sort or "newest"])
+        # Newest-first listings page by (created_at, id) cursors; the other
+        # orderings keep numbered pages.
+        self.cursor_pagination = sort in (None, "newest")
+
+        # Search: ranked full-text matches, or icontains without FTS support
         query = self.request.GET.get("q")
         if query:
-            queryset = queryset.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).distinct()
+            matches = search.search(queryset, query)
+            if matches is None:
+                queryset = queryset.filter(
+                    Q(name__icontains=query) |
+                    Q(description__icontains=query) |
+                    Q(tags__name__icontains=query)
+                ).distinct()
+            elif sort:
+                queryset = matches
+            else:
+                queryset = matches.order_by("search_rank", "-created_at")
+                self.cursor_pagination = False
+
+        # Price filter
+        min_price = self.request.GET.get("min_price")
+        max_price = self.request.GET.get("max_price")
+        if min_price:
+            queryset = queryset.filter(current_price__gte=min_price)
+        if max_price:
+            queryset = queryset.filter(current_price__lte=max_price)
+        price_bucket = facets.parse_price_bucket(self.request.GET.get("price_bucket"))
+        if price_bucket is not None:
+            queryset = queryset.filter(facets.price_bucket_filter(price_bucket))
+
+        # Facet counts ignore the category and brand selections themselves
+        self.facet_queryset = queryset
 
         # Filter by category
         category = self.request.GET.get("category")
@@ -411,26 +461,74 @@ class ProductsListView(ListView):
         if brand:
             queryset = queryset.filter(brand__id=brand)
 
-        # Price filter
-        min_price = self.request.GET.get("min_price")
-        max_price = self.request.GET.get("max_price")
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-
         return queryset
 
+    def get_facets(self):
+        """Category, brand and price bucket options with match counts."""
+        get = self.request.GET.get
+        brand = get("brand", "")
+        selected_brand = int(brand) if brand.isdigit() else None
+        counts = facets.facet_counts(
+            self.facet_queryset,
+            query=get("q", ""),
+            min_price=get("min_price", ""),
+            max_price=get("max_price", ""),
+            price_bucket=facets.parse_price_bucket(get("price_bucket")),
+            category=get("category") or None,
+            brand_id=selected_brand,
+        )
+
+        brands = Brand.objects.filter(
+            Q(id__in=counts["brands"]) | Q(id=selected_brand)
+        ).order_by("name")
+        for b in brands:
+            b.product_count = counts["brands"].get(b.id, 0)
+
+        params = self.request.GET.copy()
+        for param in ("page", "cursor", "min_price", "max_price", "price_bucket"):
+            params.pop(param, None)
+        price_buckets = []
+        for i, ((low, high), count) in enumerate(zip(facets.PRICE_BUCKETS, counts["price_buckets"])):
+            if count:
+                bucket_params = params.copy()
+                bucket_params["price_bucket"] = i
+                price_buckets.append({
+                    "low": low, "high": high, "count": count,
+                    "querystring": bucket_params.urlencode(),
+                })
+
+        return {
+            "categories": facets.category_options(counts["categories"], get("category")),
+            "brands": brands,
+            "price_buckets": price_buckets,
+        }
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         params = self.request.GET.copy()
-        if "page" in params:
-            params.pop("page")
+        for param in ("page", "cursor"):
+            params.pop(param, None)
         context["querystring"] = params.urlencode()
-        context["brands"] = Brand.objects.all()
-        context["categories"] = Category.choices
+        context["cursor_pagination"] = self.cursor_pagination
+        # Counting the whole filtered set is the expensive part of a page
+        # view, so it is only done on request (?count=1).
+        if self.request.GET.get("count"):
+            context["total_count"] = self.object_list.count()
+        context.update(self.get_facets())
         context["selected_category"] = self.request.GET.get("category", "")
         context["selected_brand"] = self.request.GET.get("brand", "")
         context["search_query"] = self.request.GET.get("q", "")
+        default_sort = "relevance" if context["search_query"] else "newest"
+        context["selected_sort"] = self.request.GET.get("sort", default_sort)
         return context
 